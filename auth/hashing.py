@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import argon2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Argon2 work runs in a bounded process pool so a login burst cannot tie up the
+# WSGI threads (or the GIL) that serve everything else. Submissions beyond
+# HASH_QUEUE_LIMIT in flight are rejected with HashingBusy instead of queueing;
+# so are hashes that time out or hit a broken pool, since the password itself
+# was never checked.
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_POOL_WORKERS * 4)))
+HASH_TIMEOUT_SECS = float(os.getenv("HASH_TIMEOUT_SECS", "30"))
+HASH_RETRY_AFTER_SECS = int(os.getenv("HASH_RETRY_AFTER_SECS", "2"))
+
+
+class HashingBusy(Exception):
+    def __init__(self, message="Password hashing queue is full", retry_after=HASH_RETRY_AFTER_SECS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def build_hasher():
+    # Changing any of these makes existing hashes "need rehash" on the next login.
+    defaults = argon2.PasswordHasher()
+    return argon2.PasswordHasher(
+        time_cost=int(os.getenv("ARGON2_TIME_COST", defaults.time_cost)),
+        memory_cost=int(os.getenv("ARGON2_MEMORY_COST", defaults.memory_cost)),
+        parallelism=int(os.getenv("ARGON2_PARALLELISM", defaults.parallelism)),
+    )
+
+
+_worker_hasher = None
+
+
+def _hasher():
+    global _worker_hasher
+    if _worker_hasher is None:
+        _worker_hasher = build_hasher()
+    return _worker_hasher
+
+
+def _verify_in_worker(password_hash, password):
+    ph = _hasher()
+    try:
+        ph.verify(password_hash, password)
+    except argon2.exceptions.VerifyMismatchError:
+        return False, None
+    if ph.check_needs_rehash(password_hash):
+        return True, ph.hash(password)
+    return True, None
+
+
+def _hash_in_worker(passwords):
+    ph = _hasher()
+    return [ph.hash(password) for password in passwords]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Created on the first login, when the sweeper, job workers and request
+            # threads are already running; forking then can leave a child stuck on a
+            # lock another thread held, so workers come from a forkserver (or spawn).
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=HASH_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(start_method),
+            )
+        return _pool
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _get_pool().submit(fn, *args)
+    except BrokenProcessPool as exc:
+        _slots.release()
+        _reset_pool()
+        raise HashingBusy(f"Password hashing pool failed: {exc}")
+    # The slot is held until the task actually finishes (or is cancelled), so a
+    # timed-out task still counts against HASH_QUEUE_LIMIT while it is queued.
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT_SECS)
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusy(f"Password hashing timed out after {HASH_TIMEOUT_SECS:g}s")
+    except BrokenProcessPool as exc:
+        _reset_pool()
+        raise HashingBusy(f"Password hashing pool failed: {exc}")
+
+
+def _reset_pool():
+    # A broken pool rejects every later submission; the next call starts a new one.
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def verify_password(password_hash, password):
+    # Returns (matches, new_hash); new_hash is set when the stored hash uses outdated parameters.
+    return _run(_verify_in_worker, password_hash, password)
+
+
+def hash_passwords(*passwords):
+    return _run(_hash_in_worker, list(passwords))
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
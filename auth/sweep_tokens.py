@@ -0,0 +1,24 @@
+# One-shot or periodic cleanup of expired refresh tokens.
+# Usage: python -m auth.sweep_tokens [--batch-size 500] [--interval 3600]
+import argparse
+import time
+
+from auth import utils as auth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete expired refresh tokens.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--interval", type=int, default=0, help="Repeat every N seconds (0 = run once).")
+    args = parser.parse_args()
+
+    while True:
+        deleted = auth.sweep_expired_refresh_tokens(batch_size=args.batch_size)
+        print(f"[AUTH] Sweep complete, {deleted} tokens deleted.", flush=True)
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+
+import jwt
+from dotenv import load_dotenv
+
+from db_manager.cache import LRUCache
+
+load_dotenv()
+
+JWT_ALGORITHM = 'HS256'
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
+JWT_CACHE_TTL_SECS = float(os.getenv("JWT_CACHE_TTL_SECS", "300"))
+
+
+class KeyRing:
+    # Signing key plus older keys still accepted for verification, addressed by `kid`.
+    # JWT_SECRET/JWT_KEY_ID is the active key; JWT_PREVIOUS_SECRETS is "kid:secret,kid:secret".
+    def __init__(self, current_kid, current_secret, previous=None):
+        if not current_secret:
+            raise RuntimeError("JWT_SECRET is not configured")
+        self.current_kid = current_kid
+        self.keys = {current_kid: current_secret.encode('utf-8')}
+        for kid, secret in (previous or {}).items():
+            self.keys.setdefault(kid, secret.encode('utf-8'))
+
+    @classmethod
+    def from_env(cls):
+        previous = {}
+        for entry in os.getenv("JWT_PREVIOUS_SECRETS", "").split(','):
+            if ':' in entry:
+                kid, secret = entry.split(':', 1)
+                previous[kid.strip()] = secret.strip()
+        return cls(os.getenv("JWT_KEY_ID", "default"), os.getenv("JWT_SECRET"), previous)
+
+    def signing_key(self):
+        return self.current_kid, self.keys[self.current_kid]
+
+    def verification_key(self, kid):
+        # Tokens issued before kid headers existed were signed with the active key.
+        if kid is None:
+            return self.keys[self.current_kid]
+        key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key id: {kid}")
+        return key
+
+
+_key_ring = None
+# sha256(token) -> claims for tokens that already passed signature and claim
+# checks. Entries expire at the token's own exp (or the TTL, if sooner).
+_cache = LRUCache("jwt", max_size=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL_SECS)
+
+
+def load_keys():
+    # Called once at startup; call again after rotating secrets in the environment.
+    global _key_ring
+    _key_ring = KeyRing.from_env()
+    _cache.clear()
+    return _key_ring
+
+
+def key_ring():
+    return _key_ring if _key_ring is not None else load_keys()
+
+
+def encode(payload):
+    kid, key = key_ring().signing_key()
+    return jwt.encode(payload, key, algorithm=JWT_ALGORITHM, headers={'kid': kid})
+
+
+def decode(token, use_cache=True):
+    # Raises the same jwt.ExpiredSignatureError / jwt.InvalidTokenError as jwt.decode.
+    now = time.time()
+    digest = hashlib.sha256(token.encode('utf-8')).digest() if use_cache else None
+    if use_cache:
+        claims = _cache.get(digest, None)
+        if claims is not None:
+            return dict(claims)
+
+    ring = key_ring()
+    kid = jwt.get_unverified_header(token).get('kid')
+    claims = jwt.decode(token, ring.verification_key(kid), algorithms=[JWT_ALGORITHM])
+
+    if use_cache:
+        exp = claims.get('exp')
+        _cache.put(digest, claims, ttl=exp - now if isinstance(exp, (int, float)) else None)
+    return dict(claims)
+
+
+def cache_stats():
+    return _cache.stats()
@@ -1,7 +1,9 @@
-import jwt
 import os
+import threading
+import uuid
 import datetime as dt
 from dotenv import load_dotenv
+from auth import tokens
 from db_manager import db
 
 load_dotenv()
@@ -14,54 +16,64 @@ def generate_access_token(patient_id, role):
             minutes=int(os.getenv("ACCESS_TOKEN_LIFETIME_MINS"))
         )
     }
-    return jwt.encode(payload, os.getenv("JWT_SECRET"), algorithm='HS256')
+    return tokens.encode(payload)
 
-def generate_refresh_token(patient_id, role):
+REFRESH_TOKEN_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _now_utc_text():
+    return dt.datetime.now(dt.timezone.utc).strftime(REFRESH_TOKEN_TIME_FORMAT)
+
+def _encode_refresh_token(patient_id, role):
+    expires = dt.datetime.now(dt.timezone.utc) + dt.timedelta(
+        days=int(os.getenv("REFRESH_TOKEN_LIFETIME_DAYS"))
+    )
     payload = {
         'patient_id': patient_id,
         'role': role,
         'token_type': 'refresh',
-        'exp': dt.datetime.now(dt.timezone.utc) + dt.timedelta(
-            days=int(os.getenv("REFRESH_TOKEN_LIFETIME_DAYS"))
-        )
+        # unique per issue so a rotation within the same second never re-mints the old token
+        'jti': uuid.uuid4().hex,
+        'exp': expires
     }
-    token = jwt.encode(payload, os.getenv("JWT_SECRET"), algorithm='HS256')
+    token = tokens.encode(payload)
+    return token, expires.strftime(REFRESH_TOKEN_TIME_FORMAT)
+
+def generate_refresh_token(patient_id, role):
+    token, expires_at = _encode_refresh_token(patient_id, role)
 
     # also store in DB
-    expires_at = (dt.datetime.now(dt.timezone.utc) + dt.timedelta(
-        days=int(os.getenv("REFRESH_TOKEN_LIFETIME_DAYS"))
-    )).strftime("%Y-%m-%d %H:%M:%S")
     store_refresh_token(patient_id, token, expires_at)
 
     return token
 
-def store_refresh_token(patient_id, token, expires_at):
-    db.store_refresh_token(patient_id, token, expires_at)
-
-
-def is_valid_refresh_token(token):
-    row = db.get_refresh_token(token)
-    if not row:
+def rotate_refresh_token(old_token, patient_id, role):
+    # Returns the replacement token, or None if old_token was not a live stored token.
+    new_token, expires_at = _encode_refresh_token(patient_id, role)
+    if not db.rotate_refresh_token(old_token, patient_id, new_token, expires_at, _now_utc_text()):
         return None
+    return new_token
 
-    expires_at = row['expires_at']
+def store_refresh_token(patient_id, token, expires_at):
+    db.store_refresh_token(patient_id, token, expires_at)
 
-    # Handle both stored-as-string and datetime/iso formats defensively
-    if isinstance(expires_at, str):
-        # Supabase often returns ISO8601; if you formatted as "%Y-%m-%d %H:%M:%S", this also works.
-        try:
-            expires_at = dt.datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-        except ValueError:
-            expires_at = dt.datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S").replace(tzinfo=dt.timezone.utc)
 
-    if expires_at.tzinfo is None:
-        expires_at = expires_at.replace(tzinfo=dt.timezone.utc)
+def sweep_expired_refresh_tokens(batch_size=500):
+    deleted = db.delete_expired_refresh_tokens(_now_utc_text(), batch_size=batch_size)
+    if deleted:
+        print(f"[AUTH] Swept {deleted} expired refresh tokens.", flush=True)
+    return deleted
 
-    if dt.datetime.now(dt.timezone.utc) > expires_at:
-        return None
 
-    return row['patient_id']
+def start_refresh_token_sweeper(interval_seconds, batch_size=500):
+    stop_event = threading.Event()
 
+    def run():
+        while not stop_event.wait(interval_seconds):
+            try:
+                sweep_expired_refresh_tokens(batch_size=batch_size)
+            except Exception as exc:
+                print(f"[AUTH] Refresh token sweep failed: {exc}", flush=True)
 
-def delete_refresh_token(token):
-    db.delete_refresh_token(token)
+    thread = threading.Thread(target=run, name="refresh-token-sweeper", daemon=True)
+    thread.start()
+    return stop_event
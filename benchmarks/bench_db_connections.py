@@ -0,0 +1,84 @@
+# Per-request DB overhead: fresh sqlite3.connect per call vs the pooled connections.
+# Run from the project root: python -m benchmarks.bench_db_connections
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from db_manager import db
+from db_manager.features import pack_features
+
+WORKERS = 8
+REQUESTS = 2000
+PATIENTS = 50
+FEATURES = pack_features([0.1, 0.2, 0.3])
+
+
+def fresh_conn():
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def request_unpooled(patient_id):
+    # Mirrors the reads/writes of POST /process_patient_data with a new connection per call.
+    for sql, params in [
+        ("SELECT * FROM patients WHERE id = ?", (patient_id,)),
+        ("SELECT questions_json FROM next_questions WHERE patient_id = ?", (patient_id,)),
+        ("SELECT features_blob FROM cognitive_history WHERE patient_id = ? ORDER BY date DESC, id DESC LIMIT 50", (patient_id,)),
+        ("SELECT date, questions_json FROM question_history WHERE patient_id = ? ORDER BY date DESC, id DESC", (patient_id,)),
+        ("SELECT id, date, summary_text FROM patient_image_summaries WHERE patient_id = ? ORDER BY RANDOM() LIMIT 5", (patient_id,)),
+    ]:
+        with fresh_conn() as conn:
+            conn.execute(sql, params).fetchall()
+    with fresh_conn() as conn:
+        conn.execute(
+            "INSERT INTO cognitive_history (patient_id, date, features_blob) VALUES (?, ?, ?)",
+            (patient_id, "2026-01-01", FEATURES),
+        )
+        conn.commit()
+
+
+def request_pooled(patient_id):
+    db.get_patient_by_id(patient_id)
+    db.get_next_questions(patient_id)
+    db.get_trimmed_cognitive_history(patient_id, 50)
+    db.get_full_question_history(patient_id)
+    db.get_random_image_summaries(patient_id, 5)
+    with db.get_conn() as conn:
+        conn.execute(
+            "INSERT INTO cognitive_history (patient_id, date, features_blob) VALUES (?, ?, ?)",
+            (patient_id, "2026-01-01", FEATURES),
+        )
+
+
+def run(label, fn):
+    def timed(i):
+        started_at = time.perf_counter()
+        fn(f"B{i % PATIENTS:03d}")
+        return time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        latencies = sorted(pool.map(timed, range(REQUESTS)))
+    elapsed = time.perf_counter() - started_at
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<10} {REQUESTS / elapsed:8.0f} req/s  p50={p50:.2f}ms  p99={p99:.2f}ms")
+
+
+def main():
+    for i in range(PATIENTS):
+        db.create_new_patient(f"B{i:03d}", "x", "x", "Bench Patient", "Bench", 80, "f")
+    print(f"{WORKERS} worker threads, {REQUESTS} requests, db={db.DB_PATH}")
+    run("unpooled", request_unpooled)
+    run("pooled", request_pooled)
+    print(f"pool stats: {db.pool_stats()}")
+
+
+if __name__ == "__main__":
+    main()
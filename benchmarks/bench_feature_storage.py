@@ -0,0 +1,76 @@
+# Read throughput of cognitive history: features_json text + json.loads vs packed BLOB + np.frombuffer.
+# Both paths run the same query on the same pooled connection against tables with the
+# same (patient_id, date DESC, id DESC) index, so only the serialization differs.
+# Run from the project root: python -m benchmarks.bench_feature_storage
+import json
+import os
+import random
+import tempfile
+import time
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import numpy as np
+
+from db_manager import db
+from db_manager.features import pack_features, unpack_feature_matrix
+
+ROWS = 5000
+FEATURES = 64
+ROUNDS = 20
+
+
+def seed():
+    rng = random.Random(3)
+    vectors = [[rng.random() for _ in range(FEATURES)] for _ in range(ROWS)]
+    with db.get_conn() as conn:
+        conn.execute(
+            "CREATE TABLE legacy_history (id INTEGER PRIMARY KEY, patient_id TEXT, date TEXT, features_json TEXT)"
+        )
+        conn.execute(
+            "CREATE INDEX idx_legacy_history_patient_date ON legacy_history (patient_id, date DESC, id DESC)"
+        )
+        conn.executemany(
+            "INSERT INTO legacy_history (patient_id, date, features_json) VALUES (?, ?, ?)",
+            (("P001", f"2026-01-{i % 28 + 1:02d}", json.dumps(vector)) for i, vector in enumerate(vectors)),
+        )
+        conn.executemany(
+            "INSERT INTO cognitive_history (patient_id, date, features_blob) VALUES (?, ?, ?)",
+            (("P001", f"2026-01-{i % 28 + 1:02d}", pack_features(vector)) for i, vector in enumerate(vectors)),
+        )
+
+
+def fetch(table, column):
+    with db.get_conn() as conn:
+        return conn.execute(
+            f"SELECT {column} FROM {table} WHERE patient_id = ? ORDER BY date DESC, id DESC",
+            ("P001",),
+        ).fetchall()
+
+
+def read_json():
+    return np.array([json.loads(row[0]) for row in fetch("legacy_history", "features_json")])
+
+
+def read_blob():
+    return unpack_feature_matrix([row[0] for row in fetch("cognitive_history", "features_blob")])[0]
+
+
+def measure(label, fn):
+    fn()
+    started_at = time.perf_counter()
+    for _ in range(ROUNDS):
+        matrix = fn()
+    elapsed = (time.perf_counter() - started_at) / ROUNDS
+    print(f"{label:<5} {ROWS / elapsed:12.0f} rows/s  {elapsed * 1000:8.2f}ms per read  shape={matrix.shape}")
+
+
+def main():
+    seed()
+    print(f"{ROWS} rows x {FEATURES} features")
+    measure("json", read_json)
+    measure("blob", read_blob)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# History read latency on a 1M-row cognitive_history: full scan vs (patient_id, date, id) index.
+# Run from the project root: python -m benchmarks.bench_history_indexes
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from db_manager import db
+from db_manager.features import pack_features
+
+ROWS = 1_000_000
+PATIENTS = 2000
+QUERIES = 200
+
+
+def seed():
+    start = date(2020, 1, 1)
+    rows_per_patient = ROWS // PATIENTS
+    features = pack_features([0.1, 0.2, 0.3, 0.4])
+    with db.get_conn() as conn:
+        # Start without the index added by migration 1.
+        conn.execute("DROP INDEX IF EXISTS idx_cognitive_history_patient_date")
+        conn.executemany(
+            "INSERT INTO cognitive_history (patient_id, date, features_blob) VALUES (?, ?, ?)",
+            (
+                (f"P{p:05d}", (start + timedelta(days=d)).isoformat(), features)
+                for d in range(rows_per_patient)
+                for p in range(PATIENTS)
+            ),
+        )
+
+
+def measure(label):
+    rng = random.Random(7)
+    latencies = []
+    for _ in range(QUERIES):
+        patient_id = f"P{rng.randrange(PATIENTS):05d}"
+        started_at = time.perf_counter()
+        db.get_trimmed_cognitive_history(patient_id, 50)
+        latencies.append(time.perf_counter() - started_at)
+    with db.get_conn() as conn:
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT features_blob FROM cognitive_history "
+            "WHERE patient_id = ? ORDER BY date DESC, id DESC LIMIT 50",
+            ("P00000",),
+        ).fetchall()
+    print(
+        f"{label:<6} p50={statistics.median(latencies) * 1000:8.2f}ms  "
+        f"max={max(latencies) * 1000:8.2f}ms  plan={' / '.join(row['detail'] for row in plan)}"
+    )
+
+
+def main():
+    started_at = time.perf_counter()
+    seed()
+    print(f"Seeded {ROWS} rows for {PATIENTS} patients in {time.perf_counter() - started_at:.1f}s")
+    measure("scan")
+    with db.get_conn() as conn:
+        conn.execute(
+            "CREATE INDEX idx_cognitive_history_patient_date "
+            "ON cognitive_history (patient_id, date DESC, id DESC)"
+        )
+    measure("index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Random image-summary sampling at 10k summaries per patient: ORDER BY RANDOM() vs slot sampling,
+# plus a chi-square check that slot sampling stays uniform.
+# Run from the project root: python -m benchmarks.bench_image_sampling
+import os
+import statistics
+import tempfile
+import time
+from collections import Counter
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from db_manager import db
+
+PATIENTS = 5
+SUMMARIES_PER_PATIENT = 10_000
+QUERIES = 300
+SAMPLE_SIZE = 5
+UNIFORMITY_PATIENT_SUMMARIES = 200
+UNIFORMITY_DRAWS = 20_000
+
+
+def seed(patient_id, count):
+    with db.unit_of_work():
+        for i in range(count):
+            db.append_image_summary(patient_id, f"summary {i}", "2026-01-01")
+
+
+def order_by_random(patient_id):
+    with db.get_conn() as conn:
+        return conn.execute(
+            "SELECT id, date, summary_text FROM patient_image_summaries "
+            "WHERE patient_id = ? ORDER BY RANDOM() LIMIT ?",
+            (patient_id, SAMPLE_SIZE),
+        ).fetchall()
+
+
+def measure(label, fn):
+    latencies = []
+    for i in range(QUERIES):
+        patient_id = f"P{i % PATIENTS}"
+        started_at = time.perf_counter()
+        fn(patient_id)
+        latencies.append(time.perf_counter() - started_at)
+    print(
+        f"{label:<15} p50={statistics.median(latencies) * 1000:7.3f}ms  "
+        f"max={max(latencies) * 1000:7.3f}ms"
+    )
+
+
+def chi_square_uniformity():
+    seed("U", UNIFORMITY_PATIENT_SUMMARIES)
+    counts = Counter()
+    for _ in range(UNIFORMITY_DRAWS):
+        picked = db.get_random_image_summaries("U", SAMPLE_SIZE)
+        assert len({entry["id"] for entry in picked}) == SAMPLE_SIZE
+        counts.update(entry["id"] for entry in picked)
+
+    categories = UNIFORMITY_PATIENT_SUMMARIES
+    expected = UNIFORMITY_DRAWS * SAMPLE_SIZE / categories
+    statistic = sum((counts[key] - expected) ** 2 / expected for key in counts)
+    statistic += (categories - len(counts)) * expected
+    # Wilson-Hilferty approximation of the chi-square 0.999 quantile.
+    dof = categories - 1
+    critical = dof * (1 - 2 / (9 * dof) + 3.09 * (2 / (9 * dof)) ** 0.5) ** 3
+    verdict = "uniform" if statistic < critical else "NOT uniform"
+    print(f"chi-square={statistic:.1f} (dof={dof}, 0.999 critical={critical:.1f}) -> {verdict}")
+
+
+def main():
+    started_at = time.perf_counter()
+    for p in range(PATIENTS):
+        seed(f"P{p}", SUMMARIES_PER_PATIENT)
+    print(
+        f"Seeded {PATIENTS} x {SUMMARIES_PER_PATIENT} summaries in {time.perf_counter() - started_at:.1f}s"
+    )
+    measure("ORDER BY RANDOM", order_by_random)
+    measure("slot sampling", lambda patient_id: db.get_random_image_summaries(patient_id, SAMPLE_SIZE))
+    chi_square_uniformity()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# Login burst: Argon2 verify inline on request threads vs the bounded auth.hashing process pool.
+# Reports logins/s, login p99 and the p99 of a cheap request served concurrently.
+# Run from the project root: python -m benchmarks.bench_login_hashing
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from auth import hashing
+from db_manager import db
+
+REQUEST_THREADS = 16
+LOGINS = 200
+PASSWORD = "correct horse battery staple"
+
+
+def p99(values):
+    ordered = sorted(values)
+    return ordered[max(0, int(len(ordered) * 0.99) - 1)] * 1000
+
+
+def cheap_requests(stop_event, latencies):
+    while not stop_event.is_set():
+        started_at = time.perf_counter()
+        db.get_next_questions("B001")
+        latencies.append(time.perf_counter() - started_at)
+        time.sleep(0.005)
+
+
+def run(label, verify):
+    password_hash = hashing.build_hasher().hash(PASSWORD)
+    login_latencies = []
+    cheap_latencies = []
+    rejected = 0
+    stop_event = threading.Event()
+    background = threading.Thread(target=cheap_requests, args=(stop_event, cheap_latencies))
+    background.start()
+
+    def login(_):
+        nonlocal rejected
+        started_at = time.perf_counter()
+        try:
+            verify(password_hash, PASSWORD)
+        except hashing.HashingBusy:
+            rejected += 1
+            return
+        login_latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=REQUEST_THREADS) as pool:
+        list(pool.map(login, range(LOGINS)))
+    elapsed = time.perf_counter() - started_at
+    stop_event.set()
+    background.join()
+
+    print(
+        f"{label:<7} {len(login_latencies) / elapsed:7.1f} logins/s  "
+        f"login p50={statistics.median(login_latencies) * 1000:7.1f}ms p99={p99(login_latencies):7.1f}ms  "
+        f"rejected(503)={rejected:<4} cheap-request p99={p99(cheap_latencies):6.2f}ms"
+    )
+
+
+def main():
+    db.update_next_questions("B001", ["q1", "q2", "q3", "q4", "q5"])
+    inline_hasher = hashing.build_hasher()
+    print(
+        f"{REQUEST_THREADS} request threads, {LOGINS} logins, "
+        f"pool workers={hashing.HASH_POOL_WORKERS}, queue limit={hashing.HASH_QUEUE_LIMIT}"
+    )
+    run("inline", inline_hasher.verify)
+    hashing.verify_password(inline_hasher.hash(PASSWORD), PASSWORD)  # start the pool workers
+    run("pool", hashing.verify_password)
+    hashing.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Question-generation prompt size: the old dict-repr patient data vs the token-budgeted builder.
+# Run from the project root: python -m benchmarks.bench_prompt_size [--ollama llama3.1:8b]
+# With --ollama, each prompt is sent once (one output token) and Ollama's prompt_eval stats are printed.
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from db_manager import db
+from llm import chatbot, prompt_builder
+
+SESSIONS = 400
+FEATURES = 24
+TOPICS = ["breakfast", "your garden", "your sister", "the church fair", "school", "your first car", "the beach", "Christmas"]
+
+
+def seed():
+    rng = random.Random(5)
+    db.create_new_patient("P001", "x", "y", "Margaret Ellis", "Maggie", 81, "female")
+    for i in range(SESSIONS):
+        date = f"{2024 + i // 336}-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}"
+        db.append_cognitive_history("P001", [rng.gauss(5, 1) - i * 0.002 for _ in range(FEATURES)], date=date)
+        questions = [f"What do you remember about {rng.choice(TOPICS)} from {rng.randint(1950, 2025)}?" for _ in range(5)]
+        answers = [f"I remember it was {rng.choice(['lovely', 'cold', 'busy', 'quiet'])} and we went there often." for _ in range(5)]
+        db.append_question_history("P001", questions, answers, date=date)
+    for i in range(12):
+        db.append_image_summary("P001", f"A family photo at {rng.choice(TOPICS)} with three people smiling near a table. " * 3)
+
+
+def legacy_prompt():
+    # What prep_next_questions sent before: the patient row plus raw history as a dict repr.
+    patient = dict(db.get_patient_by_id("P001"))
+    for key in ["patient_id", "patient_password", "caregiver_password", "next_questions"]:
+        patient.pop(key, None)
+    patient["cognitive_history"] = db.get_trimmed_cognitive_history("P001", 50)
+    patient["recent_question_history"] = db.get_full_question_history("P001")[-50:]
+    patient["image_summaries"] = [entry["summary"] for entry in db.get_random_image_summaries("P001", 5)]
+    return chatbot.load_prompt("question_generation.txt", patient_data=patient, question_count=chatbot.QUESTION_COUNT)
+
+
+def compact_prompt(budget):
+    patient = db.get_patient_profile("P001")
+    context = prompt_builder.build_patient_context(
+        patient,
+        token_budget=budget,
+        image_summaries=[entry["summary"] for entry in db.get_random_image_summaries("P001", 5)],
+    )
+    return chatbot.load_prompt("question_generation.txt", patient_data=context, question_count=chatbot.QUESTION_COUNT)
+
+
+def prompt_eval(model, prompt):
+    import ollama
+
+    started_at = time.perf_counter()
+    response = ollama.generate(model=model, prompt=prompt, options={"num_predict": 1})
+    elapsed = time.perf_counter() - started_at
+    return response["prompt_eval_count"], response["prompt_eval_duration"] / 1e9, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ollama", metavar="MODEL", help="Measure prompt evaluation with this Ollama model.")
+    parser.add_argument("--budget", type=int, default=prompt_builder.QUESTION_PROMPT_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    seed()
+    prompts = {"legacy": legacy_prompt(), "compact": compact_prompt(args.budget)}
+    print(f"{SESSIONS} sessions, {FEATURES} features, token budget {args.budget}")
+    for label, prompt in prompts.items():
+        print(f"{label:<8} {len(prompt):8d} chars  ~{prompt_builder.estimate_tokens(prompt):6d} tokens (estimated)")
+
+    if args.ollama:
+        for label, prompt in prompts.items():
+            count, eval_secs, elapsed = prompt_eval(args.ollama, prompt)
+            print(f"{label:<8} prompt_eval {count:6d} tokens in {eval_secs:7.2f}s  (request {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
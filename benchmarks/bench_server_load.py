@@ -0,0 +1,104 @@
+# Server throughput and tail latency with the stub LLM backend, independent of model speed.
+# Run from the project root: python -m benchmarks.bench_server_load [--clients 16] [--requests 400]
+# Shape the stub with LLM_STUB_LATENCY_MS (e.g. lognormal:800:0.5) and LLM_STUB_FAILURE_RATE; to go
+# through the Ollama HTTP client, start python -m llm.stub_backend and set LLM_BACKEND=ollama OLLAMA_HOST=...
+import argparse
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LLM_STUB_LATENCY_MS", "lognormal:200:0.5")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+os.environ.setdefault("ACCESS_TOKEN_LIFETIME_MINS", "60")
+
+import requests
+from werkzeug.serving import make_server
+
+import run
+from auth import utils as auth
+from db_manager import db
+
+PATIENTS = 50
+FEATURES = [0.5] * 24
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+
+def process_patient_data(session, base_url, patient_id, token):
+    return session.post(
+        f"{base_url}/process_patient_data",
+        json={"patient_id": patient_id, "features": FEATURES, "transcript_text": ["I had toast."] * 5, "async": False},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+def upload_patient_images(session, base_url, patient_id, token):
+    # Distinct bytes per request so the image summary cache does not hide the stub latency.
+    files = [("image", (f"photo{i}.jpg", io.BytesIO(os.urandom(2048)), "image/jpeg")) for i in range(2)]
+    return session.post(f"{base_url}/upload_patient_images", files=files, headers={"Authorization": f"Bearer {token}"})
+
+
+def measure(label, call, base_url, tokens, clients, total):
+    local = threading.local()
+
+    def timed(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        patient_id = f"L{i % PATIENTS:03d}"
+        started_at = time.perf_counter()
+        response = call(local.session, base_url, patient_id, tokens[patient_id])
+        return time.perf_counter() - started_at, response.status_code
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - started_at
+    latencies = sorted(latency for latency, _ in results)
+    statuses = Counter(status for _, status in results)
+    print(
+        f"{label:<22} {total / elapsed:7.1f} req/s  p50={percentile(latencies, 0.5):.0f}ms  "
+        f"p95={percentile(latencies, 0.95):.0f}ms  p99={percentile(latencies, 0.99):.0f}ms  "
+        f"status={dict(sorted(statuses.items()))}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    args = parser.parse_args()
+
+    tokens = {}
+    for i in range(PATIENTS):
+        patient_id = f"L{i:03d}"
+        db.create_new_patient(patient_id, "x", "x", "Load Patient", "Load", 80, "f")
+        tokens[patient_id] = auth.generate_access_token(patient_id, "patient")
+    caregiver_tokens = {patient_id: auth.generate_access_token(patient_id, "caregiver") for patient_id in tokens}
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, run.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(
+        f"{args.clients} clients, {args.requests} requests per endpoint, "
+        f"stub latency={os.environ['LLM_STUB_LATENCY_MS']}, failure rate={os.getenv('LLM_STUB_FAILURE_RATE', '0')}"
+    )
+    try:
+        measure("/process_patient_data", process_patient_data, base_url, tokens, args.clients, args.requests)
+        measure("/upload_patient_images", upload_patient_images, base_url, caregiver_tokens, args.clients, args.requests)
+    finally:
+        server.shutdown()
+    print(f"pool stats: {db.pool_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+from db_manager.features import pack_features, unpack_features
+
+load_dotenv()
+
+# Per-patient running feature statistics (Welford's online algorithm). Each
+# baseline stores three float64 vectors indexed by feature position: count,
+# mean and M2 (sum of squared deviations), so updates and z-scores are O(features).
+# With BASELINE_WINDOW_SESSIONS > 0 the baseline freezes after that many sessions.
+BASELINE_WINDOW_SESSIONS = int(os.getenv("BASELINE_WINDOW_SESSIONS", "0"))
+
+def empty_baseline():
+    return {
+        "sessions": 0,
+        "count": np.zeros(0),
+        "mean": np.zeros(0),
+        "m2": np.zeros(0),
+    }
+
+def _grow(array, size):
+    if array.size >= size:
+        return array
+    return np.concatenate([array, np.zeros(size - array.size)])
+
+def accepts_sessions(baseline):
+    return BASELINE_WINDOW_SESSIONS <= 0 or baseline["sessions"] < BASELINE_WINDOW_SESSIONS
+
+def welford_update(baseline, values):
+    values = np.asarray(values, dtype=np.float64)
+    size = max(baseline["count"].size, values.size)
+    count = _grow(baseline["count"].copy(), size)
+    mean = _grow(baseline["mean"].copy(), size)
+    m2 = _grow(baseline["m2"].copy(), size)
+
+    index = slice(0, values.size)
+    count[index] += 1
+    delta = values - mean[index]
+    mean[index] += delta / count[index]
+    m2[index] += delta * (values - mean[index])
+
+    return {
+        "sessions": baseline["sessions"] + 1,
+        "count": count,
+        "mean": mean,
+        "m2": m2,
+    }
+
+def welford_remove(baseline, values):
+    # Inverse of welford_update for a session that is already folded in.
+    values = np.asarray(values, dtype=np.float64)
+    count = baseline["count"].copy()
+    mean = baseline["mean"].copy()
+    m2 = baseline["m2"].copy()
+
+    index = slice(0, values.size)
+    remaining = count[index] - 1
+    previous_mean = np.divide(
+        count[index] * mean[index] - values,
+        remaining,
+        out=np.zeros_like(remaining),
+        where=remaining > 0,
+    )
+    m2[index] = np.where(remaining > 0, np.maximum(m2[index] - (values - previous_mean) * (values - mean[index]), 0.0), 0.0)
+    mean[index] = previous_mean
+    count[index] = remaining
+
+    return {
+        "sessions": baseline["sessions"] - 1,
+        "count": count,
+        "mean": mean,
+        "m2": m2,
+    }
+
+def baseline_from_matrix(matrix):
+    # Batch equivalent of folding welford_update over the rows of a NaN-padded matrix.
+    if matrix.size == 0:
+        baseline = empty_baseline()
+        baseline["sessions"] = matrix.shape[0]
+        return baseline
+    present = ~np.isnan(matrix)
+    count = present.sum(axis=0).astype(np.float64)
+    totals = np.where(present, matrix, 0.0).sum(axis=0)
+    mean = np.divide(totals, count, out=np.zeros_like(totals), where=count > 0)
+    deviations = np.where(present, matrix - mean, 0.0)
+    return {
+        "sessions": matrix.shape[0],
+        "count": count,
+        "mean": mean,
+        "m2": (deviations ** 2).sum(axis=0),
+    }
+
+def std(baseline):
+    count = baseline["count"]
+    variance = np.divide(
+        baseline["m2"],
+        count - 1,
+        out=np.zeros_like(baseline["m2"]),
+        where=count > 1,
+    )
+    return np.sqrt(variance)
+
+def z_scores(baseline, values):
+    # None where the baseline has no spread (or fewer than two samples) for that feature.
+    values = np.asarray(values, dtype=np.float64)
+    size = min(values.size, baseline["mean"].size)
+    spread = std(baseline)[:size]
+    scores = (values[:size] - baseline["mean"][:size]) / np.where(spread > 0, spread, np.nan)
+    result = [None if np.isnan(score) else float(score) for score in scores]
+    return result + [None] * (values.size - size)
+
+def to_row(baseline):
+    return (
+        baseline["sessions"],
+        pack_features(baseline["count"]),
+        pack_features(baseline["mean"]),
+        pack_features(baseline["m2"]),
+    )
+
+def from_row(row):
+    if row is None:
+        return empty_baseline()
+    return {
+        "sessions": row["sessions"],
+        "count": unpack_features(row["count_blob"]).astype(np.float64),
+        "mean": unpack_features(row["mean_blob"]).astype(np.float64),
+        "m2": unpack_features(row["m2_blob"]).astype(np.float64),
+    }
+
+class _FeatureAggregate:
+    # SQLite aggregate over packed feature blobs, e.g. per-month GROUP BY queries.
+    def __init__(self):
+        self.baseline = empty_baseline()
+
+    def step(self, blob):
+        if blob is not None:
+            self.baseline = welford_update(self.baseline, unpack_features(blob))
+
+class FeatureMeanAggregate(_FeatureAggregate):
+    def finalize(self):
+        return pack_features(self.baseline["mean"])
+
+class FeatureStdAggregate(_FeatureAggregate):
+    def finalize(self):
+        return pack_features(std(self.baseline))
+
+def register_sql_functions(conn):
+    conn.create_aggregate("features_mean", 1, FeatureMeanAggregate)
+    conn.create_aggregate("features_std", 1, FeatureStdAggregate)
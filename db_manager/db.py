@@ -1,18 +1,101 @@
+import base64
 import json
 import os
-import sqlite3
+import random
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
 from dotenv import load_dotenv
 
+from db_manager import baselines
+from db_manager.cache import MISSING, LRUCache
+from db_manager.features import feature_lists, pack_features, unpack_feature_matrix, unpack_features
+from db_manager.migrations import run_migrations
+from db_manager.pool import ConnectionPool
+
 load_dotenv()
 
 DB_PATH = os.getenv("SQLITE_DB_PATH", "neurolens.db")
+FEATURE_DTYPE = os.getenv("FEATURE_DTYPE", "float64")
+
+_pool = ConnectionPool(
+    DB_PATH,
+    max_idle=int(os.getenv("SQLITE_POOL_SIZE", "8")),
+    busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    cache_size_kb=int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384")),
+    mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    on_connect=baselines.register_sql_functions,
+)
 
+_local = threading.local()
+
+@contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # Inside unit_of_work() every call on this thread shares its open transaction.
+    pinned = getattr(_local, "uow_conn", None)
+    if pinned is not None:
+        yield pinned
+        return
+
+    conn = _pool.acquire()
+    try:
+        with conn:
+            yield conn
+    finally:
+        _pool.release(conn)
+
+@contextmanager
+def unit_of_work():
+    # Groups db calls on this thread into one write transaction and one commit.
+    # Nested units join the outermost one.
+    pinned = getattr(_local, "uow_conn", None)
+    if pinned is not None:
+        yield pinned
+        return
+
+    conn = _pool.acquire()
+    _local.uow_conn = conn
+    _local.uow_invalidations = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        invalidations = _local.uow_invalidations
+        _local.uow_conn = None
+        _local.uow_invalidations = []
+        _pool.release(conn)
+        for cache, key in invalidations:
+            cache.invalidate(key)
+
+def pool_stats():
+    return _pool.stats()
+
+# Read-through caches for the hot per-request lookups. Writers in this module
+# invalidate them; PATIENT_CACHE_TTL_SECS bounds staleness across processes.
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "2048"))
+PATIENT_CACHE_TTL_SECS = float(os.getenv("PATIENT_CACHE_TTL_SECS", "60"))
+_patient_cache = LRUCache("patients", PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL_SECS)
+_next_questions_cache = LRUCache("next_questions", PATIENT_CACHE_SIZE, PATIENT_CACHE_TTL_SECS)
+
+def _cacheable():
+    # Reads inside a unit of work may see uncommitted rows, so they bypass the caches.
+    return getattr(_local, "uow_conn", None) is None
+
+def _invalidate(cache, key):
+    # Inside a unit of work, drop the entry again once the transaction ends so a
+    # concurrent reader cannot re-cache the pre-commit value.
+    cache.invalidate(key)
+    if not _cacheable():
+        _local.uow_invalidations.append((cache, key))
+
+def cache_stats():
+    return [_patient_cache.stats(), _next_questions_cache.stats()]
 
 def _row_to_dict(row):
     return dict(row) if row is not None else None
@@ -74,6 +157,7 @@ def init_db():
             """
         )
         conn.commit()
+        run_migrations(conn)
 
 def create_new_patient(patient_id, patient_password, caregiver_password, full_name, first_name, age, gender):
     with get_conn() as conn:
@@ -86,8 +170,9 @@ def create_new_patient(patient_id, patient_password, caregiver_password, full_na
             """,
             (patient_id, patient_password, caregiver_password, full_name, first_name, age, gender, ""),
         )
-        conn.commit()
 
+    _invalidate(_patient_cache, patient_id)
+    _invalidate(_next_questions_cache, patient_id)
     print(f"Created user {patient_id} with empty history.")
     return get_patient_by_id(patient_id)
 
@@ -101,6 +186,59 @@ def get_patient_by_id(patient_id):
         row = conn.execute("SELECT * FROM patients WHERE id = ?", (patient_id,)).fetchone()
     return _row_to_dict(row)
 
+PATIENT_PROFILE_COLUMNS = "id, full_name, first_name, age, gender, description"
+
+def get_patients_page(after=None, limit=50, patient_id=None):
+    # Profile columns only: the password hashes never leave the database here.
+    with get_conn() as conn:
+        if patient_id is not None:
+            rows = conn.execute(
+                f"SELECT {PATIENT_PROFILE_COLUMNS} FROM patients WHERE id = ?",
+                (patient_id,),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"""
+                SELECT {PATIENT_PROFILE_COLUMNS} FROM patients
+                WHERE id > ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (after if after is not None else "", limit),
+            ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+def get_patient_profile(patient_id):
+    # Patient row without the credential columns, served from the patient cache.
+    if _cacheable():
+        cached = _patient_cache.get(patient_id)
+        if cached is not MISSING:
+            return dict(cached) if cached is not None else None
+
+    with get_conn() as conn:
+        row = conn.execute(
+            f"SELECT {PATIENT_PROFILE_COLUMNS} FROM patients WHERE id = ?",
+            (patient_id,),
+        ).fetchone()
+    profile = _row_to_dict(row)
+
+    if _cacheable():
+        _patient_cache.put(patient_id, profile)
+    return dict(profile) if profile is not None else None
+
+PASSWORD_COLUMNS = {
+    "patient": "patient_password",
+    "caregiver": "caregiver_password",
+}
+
+def update_patient_password(patient_id, role, password_hash):
+    column = PASSWORD_COLUMNS[role]
+    with get_conn() as conn:
+        conn.execute(
+            f"UPDATE patients SET {column} = ? WHERE id = ?",
+            (password_hash, patient_id),
+        )
+
 def append_cognitive_history(patient_id, features_dict, date=None):
     if not date:
         date = datetime.now().strftime("%Y-%m-%d")
@@ -108,12 +246,12 @@ def append_cognitive_history(patient_id, features_dict, date=None):
     with get_conn() as conn:
         cursor = conn.execute(
             """
-            INSERT INTO cognitive_history (patient_id, date, features_json)
+            INSERT INTO cognitive_history (patient_id, date, features_blob)
             VALUES (?, ?, ?)
             """,
-            (patient_id, date, _serialize_json(features_dict)),
+            (patient_id, date, pack_features(features_dict, FEATURE_DTYPE)),
         )
-        conn.commit()
+        _update_cognitive_baseline(conn, patient_id, features_dict)
 
     print(f"Appended cognitive history for {patient_id}.")
     return {
@@ -123,6 +261,86 @@ def append_cognitive_history(patient_id, features_dict, date=None):
         "features_json": features_dict,
     }
 
+def _update_cognitive_baseline(conn, patient_id, features):
+    # Runs inside the history insert's transaction so the baseline never drifts from the rows.
+    baseline = baselines.from_row(conn.execute(
+        "SELECT sessions, count_blob, mean_blob, m2_blob FROM cognitive_baselines WHERE patient_id = ?",
+        (patient_id,),
+    ).fetchone())
+    if not baselines.accepts_sessions(baseline):
+        return
+    conn.execute(
+        """
+        INSERT INTO cognitive_baselines (patient_id, sessions, count_blob, mean_blob, m2_blob)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(patient_id) DO UPDATE SET
+            sessions = excluded.sessions,
+            count_blob = excluded.count_blob,
+            mean_blob = excluded.mean_blob,
+            m2_blob = excluded.m2_blob
+        """,
+        (patient_id, *baselines.to_row(baselines.welford_update(baseline, features))),
+    )
+
+def get_cognitive_baseline(patient_id):
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT sessions, count_blob, mean_blob, m2_blob FROM cognitive_baselines WHERE patient_id = ?",
+            (patient_id,),
+        ).fetchone()
+    return baselines.from_row(row)
+
+def get_latest_session_baseline(patient_id):
+    # Returns (date, features, baseline) for the newest session, or None. The
+    # baseline excludes that session, so it is not scored against itself: if the
+    # running baseline already holds it, its Welford update is reversed.
+    with get_conn() as conn:
+        # One read transaction (one WAL snapshot) for all three reads, so a session
+        # appended in between cannot pair a new baseline with an old count.
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        row = conn.execute(
+            """
+            SELECT id, date, features_blob
+            FROM cognitive_history
+            WHERE patient_id = ?
+            ORDER BY date DESC, id DESC
+            LIMIT 1
+            """,
+            (patient_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        baseline = baselines.from_row(conn.execute(
+            "SELECT sessions, count_blob, mean_blob, m2_blob FROM cognitive_baselines WHERE patient_id = ?",
+            (patient_id,),
+        ).fetchone())
+        # The baseline holds the patient's first `sessions` rows in id order.
+        position = conn.execute(
+            "SELECT COUNT(*) FROM cognitive_history WHERE patient_id = ? AND id <= ?",
+            (patient_id, row["id"]),
+        ).fetchone()[0]
+
+    latest = unpack_features(row["features_blob"]).tolist()
+    if position <= baseline["sessions"]:
+        baseline = baselines.welford_remove(baseline, latest)
+    return row["date"], latest, baseline
+
+def get_latest_feature_zscores(patient_id):
+    # O(features): one baseline row plus the newest session via the patient/date index.
+    latest_session = get_latest_session_baseline(patient_id)
+    if latest_session is None:
+        return None
+    date, latest, baseline = latest_session
+    return {
+        "date": date,
+        "features": latest,
+        "baseline_sessions": baseline["sessions"],
+        "baseline_mean": baseline["mean"].tolist(),
+        "baseline_std": baselines.std(baseline).tolist(),
+        "z_scores": baselines.z_scores(baseline, latest),
+    }
+
 def append_question_history(patient_id, questions, answers, date=None):
     if not date:
         date = datetime.now().strftime("%Y-%m-%d")
@@ -137,7 +355,6 @@ def append_question_history(patient_id, questions, answers, date=None):
             """,
             (patient_id, date, _serialize_json(qa_pairs)),
         )
-        conn.commit()
 
     print(f"Appended question history for {patient_id}.")
     return {
@@ -148,16 +365,21 @@ def append_question_history(patient_id, questions, answers, date=None):
     }
 
 def get_next_questions(patient_id):
+    if _cacheable():
+        cached = _next_questions_cache.get(patient_id)
+        if cached is not MISSING:
+            return list(cached)
+
     with get_conn() as conn:
         row = conn.execute(
             "SELECT questions_json FROM next_questions WHERE patient_id = ?",
             (patient_id,),
         ).fetchone()
 
-    if not row:
-        return []
-
-    return _deserialize_json(row["questions_json"], [])
+    questions = _deserialize_json(row["questions_json"], []) if row else []
+    if _cacheable():
+        _next_questions_cache.put(patient_id, questions)
+    return list(questions)
 
 def update_next_questions(patient_id, questions):
     with get_conn() as conn:
@@ -170,44 +392,260 @@ def update_next_questions(patient_id, questions):
             """,
             (patient_id, _serialize_json(questions)),
         )
-        conn.commit()
 
+    _invalidate(_next_questions_cache, patient_id)
     print(f"Updated next questions for {patient_id}.")
     return {"patient_id": patient_id, "questions_json": questions}
 
-def get_trimmed_cognitive_history(patient_id, limit=50):
+def stage_questions(patient_id, questions):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO staged_questions (patient_id, questions_json, generated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(patient_id) DO UPDATE SET
+                questions_json = excluded.questions_json,
+                generated_at = excluded.generated_at
+            """,
+            (patient_id, _serialize_json(questions), time.time()),
+        )
+
+    print(f"Staged next questions for {patient_id}.")
+
+def pop_staged_questions(patient_id, max_age_secs):
+    # Consumes the staged set; stale sets are discarded rather than served.
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT questions_json, generated_at FROM staged_questions WHERE patient_id = ?",
+            (patient_id,),
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("DELETE FROM staged_questions WHERE patient_id = ?", (patient_id,))
+
+    if row["generated_at"] < time.time() - max_age_secs:
+        return None
+    return _deserialize_json(row["questions_json"], None)
+
+def claim_idempotency_key(patient_id, idempotency_key, request_hash, ttl_secs):
+    # Returns None when the key is new (and now claimed), otherwise the earlier
+    # request: its payload hash and, once recorded, its response.
+    now = time.time()
+    with get_conn() as conn:
+        conn.execute(
+            "DELETE FROM idempotency_keys WHERE patient_id = ? AND created_at < ?",
+            (patient_id, now - ttl_secs),
+        )
+        cursor = conn.execute(
+            """
+            INSERT INTO idempotency_keys (patient_id, idempotency_key, request_hash, created_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(patient_id, idempotency_key) DO NOTHING
+            """,
+            (patient_id, idempotency_key, request_hash, now),
+        )
+        if cursor.rowcount:
+            return None
+        row = conn.execute(
+            """
+            SELECT request_hash, status_code, response_json
+            FROM idempotency_keys
+            WHERE patient_id = ? AND idempotency_key = ?
+            """,
+            (patient_id, idempotency_key),
+        ).fetchone()
+
+    return {
+        "request_hash": row["request_hash"],
+        "status_code": row["status_code"],
+        "response": _deserialize_json(row["response_json"], None),
+    }
+
+def store_idempotent_response(patient_id, idempotency_key, status_code, response):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            UPDATE idempotency_keys SET status_code = ?, response_json = ?
+            WHERE patient_id = ? AND idempotency_key = ?
+            """,
+            (status_code, _serialize_json(response), patient_id, idempotency_key),
+        )
+
+def get_patients_needing_staging(after, limit, max_age_secs):
     with get_conn() as conn:
         rows = conn.execute(
             """
-            SELECT features_json
+            SELECT p.id
+            FROM patients AS p
+            LEFT JOIN staged_questions AS s ON s.patient_id = p.id
+            WHERE p.id > ? AND (s.patient_id IS NULL OR s.generated_at < ?)
+            ORDER BY p.id
+            LIMIT ?
+            """,
+            (after, time.time() - max_age_secs, limit),
+        ).fetchall()
+    return [row["id"] for row in rows]
+
+def get_scheduler_state(name):
+    with get_conn() as conn:
+        row = conn.execute("SELECT * FROM scheduler_state WHERE name = ?", (name,)).fetchone()
+    return _row_to_dict(row)
+
+def set_scheduler_state(name, cursor, completed):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO scheduler_state (name, cursor, completed, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                cursor = excluded.cursor,
+                completed = excluded.completed,
+                updated_at = excluded.updated_at
+            """,
+            (name, cursor, int(completed), time.time()),
+        )
+
+def _load_cognitive_rows(patient_id, limit=None):
+    with get_conn() as conn:
+        rows = conn.execute(
+            """
+            SELECT date, features_blob
             FROM cognitive_history
             WHERE patient_id = ?
             ORDER BY date DESC, id DESC
             LIMIT ?
             """,
-            (patient_id, limit),
+            (patient_id, -1 if limit is None else limit),
         ).fetchall()
+    matrix, lengths = unpack_feature_matrix([row["features_blob"] for row in rows])
+    return [row["date"] for row in rows], matrix, lengths
 
-    return [_deserialize_json(row["features_json"], {}) for row in rows]
+def get_cognitive_feature_matrix(patient_id, limit=None):
+    # Newest first, one row per session; ragged vectors are NaN-padded.
+    dates, matrix, _ = _load_cognitive_rows(patient_id, limit)
+    return dates, matrix
+
+def get_trimmed_cognitive_history(patient_id, limit=50):
+    _, matrix, lengths = _load_cognitive_rows(patient_id, limit)
+    return feature_lists(matrix, lengths)
 
 def get_full_cognitive_history(patient_id):
+    dates, matrix, lengths = _load_cognitive_rows(patient_id)
+    return [
+        {"date": date, "features": features}
+        for date, features in zip(dates, feature_lists(matrix, lengths))
+    ]
+
+def get_latest_cognitive_history_id(patient_id):
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT MAX(id) FROM cognitive_history WHERE patient_id = ?",
+            (patient_id,),
+        ).fetchone()
+    return row[0]
+
+def get_monthly_cognitive_summary(patient_id, since=None):
+    # Per-month session counts and per-feature mean/std, aggregated inside SQLite
+    # (features_mean/features_std are registered on every pooled connection).
     with get_conn() as conn:
         rows = conn.execute(
             """
-            SELECT date, features_json
+            SELECT substr(date, 1, 7) AS month,
+                   COUNT(*) AS sessions,
+                   features_mean(features_blob) AS mean_blob,
+                   features_std(features_blob) AS std_blob
             FROM cognitive_history
-            WHERE patient_id = ?
-            ORDER BY date DESC, id DESC
+            WHERE patient_id = ? AND date >= ?
+            GROUP BY month
+            ORDER BY month
             """,
-            (patient_id,),
+            (patient_id, since or ""),
         ).fetchall()
-
     return [
-        {"date": row["date"], "features": _deserialize_json(row["features_json"], {})}
+        {
+            "month": row["month"],
+            "sessions": row["sessions"],
+            "mean": unpack_features(row["mean_blob"]).tolist(),
+            "std": unpack_features(row["std_blob"]).tolist(),
+        }
         for row in rows
     ]
 
-def get_full_question_history(patient_id):
+def get_cognitive_report(patient_id, days):
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT * FROM cognitive_reports WHERE patient_id = ? AND days = ?",
+            (patient_id, days),
+        ).fetchone()
+    return _row_to_dict(row)
+
+def store_cognitive_report(patient_id, days, history_id, model, report):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO cognitive_reports (patient_id, days, history_id, model, report, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(patient_id, days) DO UPDATE SET
+                history_id = excluded.history_id,
+                model = excluded.model,
+                report = excluded.report,
+                created_at = excluded.created_at
+            """,
+            (patient_id, days, history_id, model, report, time.time()),
+        )
+
+def _encode_history_cursor(date, row_id):
+    return base64.urlsafe_b64encode(f"{date}|{row_id}".encode()).decode().rstrip("=")
+
+def _decode_history_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit("|", 1)
+        return date, int(row_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError(f"Invalid history cursor: {cursor}") from exc
+
+def get_cognitive_history_range(patient_id, since=None, until=None, limit=None, cursor=None):
+    # Newest-first keyset page over (date, id). since/until are inclusive ISO date
+    # bounds compared as strings, so they use the (patient_id, date, id) index.
+    clauses = ["patient_id = ?"]
+    params = [patient_id]
+    if since is not None:
+        clauses.append("date >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("date <= ?")
+        params.append(until)
+    if cursor is not None:
+        clauses.append("(date, id) < (?, ?)")
+        params.extend(_decode_history_cursor(cursor))
+    params.append(-1 if limit is None else limit + 1)
+
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT id, date, features_blob
+            FROM cognitive_history
+            WHERE {" AND ".join(clauses)}
+            ORDER BY date DESC, id DESC
+            LIMIT ?
+            """,
+            params,
+        ).fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_history_cursor(rows[-1]["date"], rows[-1]["id"])
+
+    matrix, lengths = unpack_feature_matrix([row["features_blob"] for row in rows])
+    entries = [
+        {"date": row["date"], "features": features}
+        for row, features in zip(rows, feature_lists(matrix, lengths))
+    ]
+    return entries, next_cursor
+
+def get_full_question_history(patient_id, limit=None):
     with get_conn() as conn:
         rows = conn.execute(
             """
@@ -215,8 +653,9 @@ def get_full_question_history(patient_id):
             FROM question_history
             WHERE patient_id = ?
             ORDER BY date DESC, id DESC
+            LIMIT ?
             """,
-            (patient_id,),
+            (patient_id, -1 if limit is None else limit),
         ).fetchall()
 
     return [
@@ -224,27 +663,79 @@ def get_full_question_history(patient_id):
         for row in rows
     ]
 
+def get_asked_questions(patient_id, after_id=0):
+    # Questions from sessions with id > after_id, oldest first, plus the last id seen.
+    with get_conn() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, questions_json
+            FROM question_history
+            WHERE patient_id = ? AND id > ?
+            ORDER BY id
+            """,
+            (patient_id, after_id),
+        ).fetchall()
+    questions = [
+        pair.get("q", "")
+        for row in rows
+        for pair in _deserialize_json(row["questions_json"], [])
+    ]
+    return (rows[-1]["id"] if rows else after_id), [question for question in questions if question]
+
 def append_image_summary(patient_id, summary_text, date=None):
+    return append_image_summaries(patient_id, [summary_text], date)[0]
+
+def append_image_summaries(patient_id, summary_texts, date=None):
+    # All rows in one transaction with one count bump; slots are handed out as a block.
+    if not summary_texts:
+        return []
     if not date:
         date = datetime.now().strftime("%Y-%m-%d")
 
     with get_conn() as conn:
-        cursor = conn.execute(
+        # Bumping the count first takes the write lock, so the slots it hands out
+        # stay dense and unique per patient under concurrent uploads.
+        conn.execute(
             """
-            INSERT INTO patient_image_summaries (patient_id, date, summary_text)
-            VALUES (?, ?, ?)
+            INSERT INTO image_summary_counts (patient_id, total)
+            VALUES (?, ?)
+            ON CONFLICT(patient_id) DO UPDATE SET total = total + excluded.total
             """,
-            (patient_id, date, summary_text),
+            (patient_id, len(summary_texts)),
         )
-        conn.commit()
+        first_slot = conn.execute(
+            "SELECT total - ? FROM image_summary_counts WHERE patient_id = ?",
+            (len(summary_texts), patient_id),
+        ).fetchone()[0]
+        conn.executemany(
+            """
+            INSERT INTO patient_image_summaries (patient_id, date, summary_text, patient_slot)
+            VALUES (?, ?, ?, ?)
+            """,
+            [
+                (patient_id, date, summary_text, first_slot + offset)
+                for offset, summary_text in enumerate(summary_texts)
+            ],
+        )
+        rows = conn.execute(
+            """
+            SELECT id, summary_text FROM patient_image_summaries
+            WHERE patient_id = ? AND patient_slot >= ? AND patient_slot < ?
+            ORDER BY patient_slot
+            """,
+            (patient_id, first_slot, first_slot + len(summary_texts)),
+        ).fetchall()
 
-    print(f"Stored image summary for {patient_id}.")
-    return {
-        "id": cursor.lastrowid,
-        "patient_id": patient_id,
-        "date": date,
-        "summary": summary_text,
-    }
+    print(f"Stored {len(rows)} image summaries for {patient_id}.")
+    return [
+        {
+            "id": row["id"],
+            "patient_id": patient_id,
+            "date": date,
+            "summary": row["summary_text"],
+        }
+        for row in rows
+    ]
 
 def get_full_image_summaries(patient_id):
     with get_conn() as conn:
@@ -264,23 +755,152 @@ def get_full_image_summaries(patient_id):
     ]
 
 def get_random_image_summaries(patient_id, limit=5):
+    # Uniform sample without replacement: draw distinct slots from 0..total-1 and
+    # look them up through the (patient_id, patient_slot) index, O(limit log n).
     with get_conn() as conn:
+        row = conn.execute(
+            "SELECT total FROM image_summary_counts WHERE patient_id = ?",
+            (patient_id,),
+        ).fetchone()
+        total = row["total"] if row else 0
+        slots = random.sample(range(total), min(limit, total))
+        if not slots:
+            return []
         rows = conn.execute(
-            """
-            SELECT id, date, summary_text
+            f"""
+            SELECT id, date, summary_text, patient_slot
             FROM patient_image_summaries
-            WHERE patient_id = ?
-            ORDER BY RANDOM()
-            LIMIT ?
+            WHERE patient_id = ? AND patient_slot IN ({_placeholders(slots)})
             """,
-            (patient_id, limit),
+            [patient_id, *slots],
         ).fetchall()
 
+    by_slot = {row["patient_slot"]: row for row in rows}
     return [
         {"id": row["id"], "date": row["date"], "summary": row["summary_text"]}
-        for row in rows
+        for row in (by_slot.get(slot) for slot in slots)
+        if row is not None
     ]
 
+def _placeholders(values):
+    return ", ".join("?" for _ in values)
+
+def _group_by_patient(patient_ids, rows, build):
+    grouped = {patient_id: [] for patient_id in patient_ids}
+    for row in rows:
+        grouped[row["patient_id"]].append(build(row))
+    return grouped
+
+def get_cognitive_history_for_patients(patient_ids):
+    if not patient_ids:
+        return {}
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT patient_id, date, features_blob
+            FROM cognitive_history
+            WHERE patient_id IN ({_placeholders(patient_ids)})
+            ORDER BY patient_id, date DESC, id DESC
+            """,
+            list(patient_ids),
+        ).fetchall()
+
+    matrix, lengths = unpack_feature_matrix([row["features_blob"] for row in rows])
+    features = iter(feature_lists(matrix, lengths))
+    return _group_by_patient(
+        patient_ids,
+        rows,
+        lambda row: {"date": row["date"], "features": next(features)},
+    )
+
+def get_question_history_for_patients(patient_ids):
+    if not patient_ids:
+        return {}
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT patient_id, date, questions_json
+            FROM question_history
+            WHERE patient_id IN ({_placeholders(patient_ids)})
+            ORDER BY patient_id, date DESC, id DESC
+            """,
+            list(patient_ids),
+        ).fetchall()
+
+    return _group_by_patient(
+        patient_ids,
+        rows,
+        lambda row: {"date": row["date"], "qa": _deserialize_json(row["questions_json"], [])},
+    )
+
+def get_image_summaries_for_patients(patient_ids):
+    if not patient_ids:
+        return {}
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT patient_id, id, date, summary_text
+            FROM patient_image_summaries
+            WHERE patient_id IN ({_placeholders(patient_ids)})
+            ORDER BY patient_id, date DESC, id DESC
+            """,
+            list(patient_ids),
+        ).fetchall()
+
+    return _group_by_patient(
+        patient_ids,
+        rows,
+        lambda row: {"id": row["id"], "date": row["date"], "summary": row["summary_text"]},
+    )
+
+def get_next_questions_for_patients(patient_ids):
+    if not patient_ids:
+        return {}
+    with get_conn() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT patient_id, questions_json
+            FROM next_questions
+            WHERE patient_id IN ({_placeholders(patient_ids)})
+            """,
+            list(patient_ids),
+        ).fetchall()
+
+    grouped = {patient_id: [] for patient_id in patient_ids}
+    for row in rows:
+        grouped[row["patient_id"]] = _deserialize_json(row["questions_json"], [])
+    return grouped
+
+def get_history_counts_for_patients(patient_ids):
+    if not patient_ids:
+        return {}
+    counts = {
+        patient_id: {
+            "cognitive_history_count": 0,
+            "question_history_count": 0,
+            "image_summary_count": 0,
+        }
+        for patient_id in patient_ids
+    }
+    with get_conn() as conn:
+        for table, key in (
+            ("cognitive_history", "cognitive_history_count"),
+            ("question_history", "question_history_count"),
+            ("patient_image_summaries", "image_summary_count"),
+        ):
+            rows = conn.execute(
+                f"""
+                SELECT patient_id, COUNT(*) AS total
+                FROM {table}
+                WHERE patient_id IN ({_placeholders(patient_ids)})
+                GROUP BY patient_id
+                """,
+                list(patient_ids),
+            ).fetchall()
+            for row in rows:
+                counts[row["patient_id"]][key] = row["total"]
+    return counts
+
 def store_refresh_token(patient_id, token, expires_at):
     with get_conn() as conn:
         conn.execute(
@@ -290,35 +910,71 @@ def store_refresh_token(patient_id, token, expires_at):
             """,
             (patient_id, token, expires_at),
         )
-        conn.commit()
 
-def get_refresh_token(token):
+def rotate_refresh_token(old_token, patient_id, new_token, new_expires_at, now):
+    # Validate-and-consume the presented token and store its replacement in one
+    # transaction; returns False if the old token was unknown, foreign or expired.
     with get_conn() as conn:
-        row = conn.execute(
+        deleted = conn.execute(
             """
-            SELECT patient_id, expires_at
-            FROM refresh_tokens
-            WHERE token = ?
+            DELETE FROM refresh_tokens
+            WHERE token = ? AND patient_id = ? AND expires_at > ?
             """,
-            (token,),
-        ).fetchone()
-    return _row_to_dict(row)
-
-def delete_refresh_token(token):
-    with get_conn() as conn:
-        conn.execute("DELETE FROM refresh_tokens WHERE token = ?", (token,))
-        conn.commit()
+            (old_token, patient_id, now),
+        ).rowcount
+        if deleted != 1:
+            return False
+        conn.execute(
+            """
+            INSERT INTO refresh_tokens (patient_id, token, expires_at)
+            VALUES (?, ?, ?)
+            """,
+            (patient_id, new_token, new_expires_at),
+        )
+    return True
+
+def delete_expired_refresh_tokens(now, batch_size=500):
+    # Short bounded batches over the expires_at index keep each write lock brief.
+    total = 0
+    while True:
+        with get_conn() as conn:
+            deleted = conn.execute(
+                """
+                DELETE FROM refresh_tokens
+                WHERE token IN (
+                    SELECT token FROM refresh_tokens
+                    WHERE expires_at <= ?
+                    LIMIT ?
+                )
+                """,
+                (now, batch_size),
+            ).rowcount
+        total += deleted
+        if deleted < batch_size:
+            return total
 
 def hard_clear():
     with get_conn() as conn:
         conn.execute("DELETE FROM cognitive_history")
+        conn.execute("DELETE FROM cognitive_baselines")
         conn.execute("DELETE FROM question_history")
         conn.execute("DELETE FROM patient_image_summaries")
+        conn.execute("DELETE FROM image_summary_counts")
+        conn.execute("DELETE FROM image_summary_cache")
+        conn.execute("DELETE FROM image_summary_cache_bands")
         conn.execute("DELETE FROM next_questions")
+        conn.execute("DELETE FROM staged_questions")
+        conn.execute("DELETE FROM cognitive_reports")
+        conn.execute("DELETE FROM llm_calls")
+        conn.execute("DELETE FROM idempotency_keys")
+        conn.execute("DELETE FROM question_jobs")
+        conn.execute("DELETE FROM scheduler_state")
+        conn.execute("DELETE FROM export_watermarks")
         conn.execute("DELETE FROM refresh_tokens")
         conn.execute("DELETE FROM patients")
-        conn.commit()
 
+    _patient_cache.clear()
+    _next_questions_cache.clear()
     print("Cleared all patients and related data.")
 
 init_db()
@@ -0,0 +1,161 @@
+# Incremental Parquet export of history tables for offline analytics.
+# Usage: python -m db_manager.export [--out ./exports] [--tables cognitive_history question_history]
+#                                    [--chunk-size 50000] [--full]
+# Output is hive-partitioned: <out>/<table>/patient_id=<id>/month=<YYYY-MM>/part-<chunk first id>.parquet
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from urllib.parse import quote
+
+from db_manager import db
+from db_manager.features import feature_lists, unpack_feature_matrix
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+DEFAULT_CHUNK_SIZE = 50_000
+LAST_RUN_FILE = "_last_run.json"
+
+def _frame(columns):
+    # pandas/pyarrow are only needed by the exporter, not by the web process importing this module.
+    import pandas as pd
+    return pd.DataFrame(columns)
+
+def _cognitive_frame(rows):
+    matrix, lengths = unpack_feature_matrix([row["features_blob"] for row in rows])
+    return _frame({
+        "id": [row["id"] for row in rows],
+        "patient_id": [row["patient_id"] for row in rows],
+        "date": [row["date"] for row in rows],
+        "features": feature_lists(matrix, lengths),
+    })
+
+def _question_frame(rows):
+    return _frame({
+        "id": [row["id"] for row in rows],
+        "patient_id": [row["patient_id"] for row in rows],
+        "date": [row["date"] for row in rows],
+        "qa_json": [row["questions_json"] for row in rows],
+    })
+
+EXPORT_TABLES = {
+    "cognitive_history": ("SELECT id, patient_id, date, features_blob FROM cognitive_history", _cognitive_frame),
+    "question_history": ("SELECT id, patient_id, date, questions_json FROM question_history", _question_frame),
+}
+
+def get_watermark(table):
+    with db.get_conn() as conn:
+        row = conn.execute(
+            "SELECT last_id FROM export_watermarks WHERE table_name = ?",
+            (table,),
+        ).fetchone()
+    return row["last_id"] if row else 0
+
+def set_watermark(table, last_id):
+    with db.get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO export_watermarks (table_name, last_id, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(table_name) DO UPDATE SET
+                last_id = excluded.last_id,
+                updated_at = excluded.updated_at
+            """,
+            (table, last_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+
+def _write_partitions(frame, table_dir, chunk_start):
+    # Files are named after the chunk's first id, so re-exporting a chunk after a
+    # crash (before its watermark was saved) overwrites the same files.
+    frame["month"] = frame["date"].str.slice(0, 7)
+    files = 0
+    for (patient_id, month), part in frame.groupby(["patient_id", "month"], sort=False):
+        part_dir = os.path.join(table_dir, f"patient_id={quote(str(patient_id), safe='')}", f"month={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        part_path = os.path.join(part_dir, f"part-{chunk_start}.parquet")
+        part.drop(columns=["patient_id", "month"]).to_parquet(part_path, index=False)
+        files += 1
+    return files
+
+def export_table(table, out_dir=EXPORT_DIR, chunk_size=DEFAULT_CHUNK_SIZE, full=False, verbose=True):
+    # Streams rows past the table's watermark in id order, one chunk in memory at a
+    # time, and advances the watermark after each chunk so an interrupted run resumes.
+    select_sql, build_frame = EXPORT_TABLES[table]
+    table_dir = os.path.join(out_dir, table)
+    if full:
+        # A full export replaces the table's files rather than adding copies next to them.
+        shutil.rmtree(table_dir, ignore_errors=True)
+        set_watermark(table, 0)
+    last_id = get_watermark(table)
+    started_at = time.perf_counter()
+    rows_exported = 0
+    files_written = 0
+
+    while True:
+        with db.get_conn() as conn:
+            rows = conn.execute(
+                f"{select_sql} WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size),
+            ).fetchall()
+        if not rows:
+            break
+
+        files_written += _write_partitions(build_frame(rows), table_dir, rows[0]["id"])
+        last_id = rows[-1]["id"]
+        rows_exported += len(rows)
+        set_watermark(table, last_id)
+        if verbose:
+            print(f"[EXPORT] {table}: {rows_exported} rows exported (watermark id={last_id})", flush=True)
+
+    elapsed = time.perf_counter() - started_at
+    stats = {
+        "table": table,
+        "rows": rows_exported,
+        "files": files_written,
+        "watermark": last_id,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows_exported / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+    if verbose:
+        print(
+            f"[EXPORT] {table}: {rows_exported} rows in {elapsed:.2f}s "
+            f"({stats['rows_per_second']:.0f} rows/s, {files_written} files)",
+            flush=True,
+        )
+    return stats
+
+def run_export(tables=None, out_dir=EXPORT_DIR, chunk_size=DEFAULT_CHUNK_SIZE, full=False, verbose=True):
+    started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    results = [
+        export_table(table, out_dir=out_dir, chunk_size=chunk_size, full=full, verbose=verbose)
+        for table in (tables or list(EXPORT_TABLES))
+    ]
+    summary = {
+        "started_at": started,
+        "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "tables": results,
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, LAST_RUN_FILE), "w", encoding="utf-8") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    return summary
+
+def read_last_run(out_dir=EXPORT_DIR):
+    try:
+        with open(os.path.join(out_dir, LAST_RUN_FILE), "r", encoding="utf-8") as summary_file:
+            return json.load(summary_file)
+    except FileNotFoundError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Export history tables to partitioned Parquet.")
+    parser.add_argument("--out", default=EXPORT_DIR)
+    parser.add_argument("--tables", nargs="+", choices=sorted(EXPORT_TABLES), default=None)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--full", action="store_true", help="Ignore watermarks and re-export everything.")
+    args = parser.parse_args()
+    run_export(tables=args.tables, out_dir=args.out, chunk_size=args.chunk_size, full=args.full)
+
+if __name__ == "__main__":
+    main()
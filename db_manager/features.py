@@ -0,0 +1,68 @@
+import struct
+
+import numpy as np
+
+# Packed feature vector layout: 8-byte header followed by the raw little-endian values.
+#   2s magic b"NF" | B format version | c dtype code (b"f" float32, b"d" float64) | I value count
+# The header keeps float64 payloads 8-byte aligned so np.frombuffer can view them in place.
+_MAGIC = b"NF"
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct("<2sBcI")
+_DTYPES = {
+    b"f": np.dtype("<f4"),
+    b"d": np.dtype("<f8"),
+}
+_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+HEADER_SIZE = _HEADER.size
+
+def pack_features(values, dtype="float64"):
+    array = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    if array.ndim != 1:
+        raise ValueError(f"Feature vector must be one-dimensional, got shape {array.shape}")
+    code = _CODES.get(array.dtype)
+    if code is None:
+        raise ValueError(f"Unsupported feature dtype: {array.dtype}")
+    return _HEADER.pack(_MAGIC, _FORMAT_VERSION, code, array.size) + array.tobytes()
+
+def _read_header(blob):
+    if len(blob) < HEADER_SIZE:
+        raise ValueError("Feature blob is shorter than its header")
+    magic, version, code, length = _HEADER.unpack_from(blob)
+    if magic != _MAGIC or version != _FORMAT_VERSION or code not in _DTYPES:
+        raise ValueError("Unrecognised feature blob header")
+    dtype = _DTYPES[code]
+    if len(blob) != HEADER_SIZE + length * dtype.itemsize:
+        raise ValueError("Feature blob length does not match its header")
+    return dtype, length
+
+def unpack_features(blob):
+    dtype, length = _read_header(blob)
+    return np.frombuffer(blob, dtype=dtype, count=length, offset=HEADER_SIZE)
+
+def unpack_feature_matrix(blobs):
+    # Returns (matrix, lengths). Rows of equal length and dtype are joined into one
+    # buffer and viewed as a 2-D array; ragged rows are NaN-padded to the longest.
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float64), np.empty(0, dtype=np.int64)
+
+    headers = [_read_header(blob) for blob in blobs]
+    lengths = np.fromiter((length for _, length in headers), dtype=np.int64, count=len(headers))
+    dtypes = {dtype for dtype, _ in headers}
+
+    if len(dtypes) == 1 and lengths.min() == lengths.max():
+        dtype = dtypes.pop()
+        payload = b"".join(memoryview(blob)[HEADER_SIZE:] for blob in blobs)
+        matrix = np.frombuffer(payload, dtype=dtype).reshape(len(blobs), int(lengths[0]))
+        return matrix, lengths
+
+    matrix = np.full((len(blobs), int(lengths.max())), np.nan, dtype=np.float64)
+    for index, blob in enumerate(blobs):
+        row = unpack_features(blob)
+        matrix[index, :row.size] = row
+    return matrix, lengths
+
+def feature_lists(matrix, lengths):
+    if matrix.size == 0 or lengths.min() == lengths.max():
+        return matrix.tolist()
+    return [row[:length].tolist() for row, length in zip(matrix, lengths)]
@@ -0,0 +1,100 @@
+import os
+import time
+
+from db_manager import db
+
+# Content-addressed store for vision-model summaries. Exact matches use the
+# SHA-256 of the image bytes; near-duplicates (re-compressed or resized copies)
+# match on a 64-bit perceptual hash within IMAGE_PHASH_MAX_DISTANCE bits. Exact
+# hits are shared across patients, near-duplicates only within one patient's
+# uploads: a different photo that happens to hash close must never pick up
+# another patient's people and places.
+PHASH_BANDS = 8
+PHASH_BAND_BITS = 64 // PHASH_BANDS
+IMAGE_PHASH_MAX_DISTANCE = min(int(os.getenv("IMAGE_PHASH_MAX_DISTANCE", "4")), PHASH_BANDS - 1)
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit.
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+def _bands(phash):
+    mask = (1 << PHASH_BAND_BITS) - 1
+    return [(band, (phash >> (band * PHASH_BAND_BITS)) & mask) for band in range(PHASH_BANDS)]
+
+def _record_hit(conn, row):
+    conn.execute(
+        "UPDATE image_summary_cache SET hits = hits + 1, last_hit_at = ? WHERE id = ?",
+        (time.time(), row["id"]),
+    )
+    return {"summary": row["summary"], "match": None, "cache_id": row["id"]}
+
+def lookup_exact(sha256, model, prompt_version):
+    with db.get_conn() as conn:
+        row = conn.execute(
+            """
+            SELECT id, summary FROM image_summary_cache
+            WHERE sha256 = ? AND model = ? AND prompt_version = ?
+            """,
+            (sha256, model, prompt_version),
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(_record_hit(conn, row), match="exact")
+
+def lookup_near(phash, model, prompt_version, patient_id):
+    if phash is None or patient_id is None:
+        return None
+    clauses = " OR ".join("(b.band = ? AND b.value = ?)" for _ in range(PHASH_BANDS))
+    params = [value for pair in _bands(phash) for value in pair]
+    with db.get_conn() as conn:
+        candidates = conn.execute(
+            f"""
+            SELECT DISTINCT c.id, c.phash, c.summary
+            FROM image_summary_cache_bands b
+            JOIN image_summary_cache c ON c.id = b.cache_id
+            WHERE b.patient_id = ? AND ({clauses}) AND c.model = ? AND c.prompt_version = ?
+            """,
+            [patient_id] + params + [model, prompt_version],
+        ).fetchall()
+        best = None
+        for candidate in candidates:
+            distance = bin(_to_unsigned(candidate["phash"]) ^ phash).count("1")
+            if distance <= IMAGE_PHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+                best = (distance, candidate)
+        if best is None:
+            return None
+        return dict(_record_hit(conn, best[1]), match="near", distance=best[0])
+
+def store(sha256, phash, model, prompt_version, summary, patient_id=None):
+    with db.get_conn() as conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO image_summary_cache (sha256, phash, model, prompt_version, summary, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (sha256, model, prompt_version) DO NOTHING
+            """,
+            (sha256, None if phash is None else _to_signed(phash), model, prompt_version, summary, time.time()),
+        )
+        if phash is None or patient_id is None:
+            return
+        cache_id = cursor.lastrowid if cursor.rowcount else conn.execute(
+            "SELECT id FROM image_summary_cache WHERE sha256 = ? AND model = ? AND prompt_version = ?",
+            (sha256, model, prompt_version),
+        ).fetchone()["id"]
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO image_summary_cache_bands (patient_id, band, value, cache_id)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(patient_id, band, value, cache_id) for band, value in _bands(phash)],
+        )
+
+def stats():
+    with db.get_conn() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits FROM image_summary_cache"
+        ).fetchone()
+    return {"entries": row["entries"], "hits": row["hits"]}
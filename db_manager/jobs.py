@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import socket
+import time
+
+from db_manager import db
+
+# SQLite-backed queue for question-generation jobs.
+# Lifecycle: queued -> running -> succeeded, or back to queued with backoff on
+# failure, and dead once max_attempts is used up.
+JOB_MAX_ATTEMPTS = int(os.getenv("QUESTION_JOB_MAX_ATTEMPTS", "4"))
+JOB_BACKOFF_BASE_SECS = float(os.getenv("QUESTION_JOB_BACKOFF_SECS", "5"))
+JOB_BACKOFF_MAX_SECS = float(os.getenv("QUESTION_JOB_BACKOFF_MAX_SECS", "300"))
+JOB_LEASE_SECS = float(os.getenv("QUESTION_JOB_LEASE_SECS", "900"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+def _job_to_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job.pop("result_json")) if job.get("result_json") else None
+    return job
+
+def enqueue(patient_id, kind="next_questions", max_attempts=JOB_MAX_ATTEMPTS):
+    # A job still waiting in the queue reads the patient's latest data when it
+    # runs, so a second submission joins it instead of queueing another generation.
+    now = time.time()
+    with db.get_conn() as conn:
+        queued = conn.execute(
+            """
+            SELECT id FROM question_jobs
+            WHERE patient_id = ? AND kind = ? AND status = 'queued' AND attempts = 0
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (patient_id, kind),
+        ).fetchone()
+        if queued:
+            return queued["id"]
+        cursor = conn.execute(
+            """
+            INSERT INTO question_jobs (
+                patient_id, kind, status, attempts, max_attempts,
+                next_run_at, created_at, updated_at
+            ) VALUES (?, ?, 'queued', 0, ?, ?, ?, ?)
+            """,
+            (patient_id, kind, max_attempts, now, now, now),
+        )
+    return cursor.lastrowid
+
+def get_job(job_id):
+    with db.get_conn() as conn:
+        row = conn.execute("SELECT * FROM question_jobs WHERE id = ?", (job_id,)).fetchone()
+    return _job_to_dict(row)
+
+def get_pending_job(patient_id):
+    with db.get_conn() as conn:
+        row = conn.execute(
+            """
+            SELECT * FROM question_jobs
+            WHERE patient_id = ? AND status IN ('queued', 'running')
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (patient_id,),
+        ).fetchone()
+    return _job_to_dict(row)
+
+def claim_next(worker_id=WORKER_ID):
+    now = time.time()
+    with db.unit_of_work() as conn:
+        row = conn.execute(
+            """
+            SELECT * FROM question_jobs
+            WHERE status = 'queued' AND next_run_at <= ?
+            ORDER BY next_run_at, id
+            LIMIT 1
+            """,
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            """
+            UPDATE question_jobs
+            SET status = 'running', attempts = attempts + 1,
+                locked_by = ?, locked_at = ?, updated_at = ?
+            WHERE id = ?
+            """,
+            (worker_id, now, now, row["id"]),
+        )
+    job = _job_to_dict(row)
+    job.update(status="running", attempts=job["attempts"] + 1, locked_by=worker_id, locked_at=now)
+    return job
+
+def complete(job_id, result):
+    now = time.time()
+    with db.get_conn() as conn:
+        conn.execute(
+            """
+            UPDATE question_jobs
+            SET status = 'succeeded', result_json = ?, last_error = NULL,
+                locked_by = NULL, locked_at = NULL, updated_at = ?
+            WHERE id = ?
+            """,
+            (json.dumps(result), now, job_id),
+        )
+
+def fail(job, error, permanent=False):
+    # Exponential backoff with jitter; dead-letters once attempts are exhausted.
+    now = time.time()
+    dead = permanent or job["attempts"] >= job["max_attempts"]
+    delay = min(JOB_BACKOFF_MAX_SECS, JOB_BACKOFF_BASE_SECS * 2 ** (job["attempts"] - 1))
+    delay *= random.uniform(0.8, 1.2)
+    with db.get_conn() as conn:
+        conn.execute(
+            """
+            UPDATE question_jobs
+            SET status = ?, last_error = ?, next_run_at = ?,
+                locked_by = NULL, locked_at = NULL, updated_at = ?
+            WHERE id = ?
+            """,
+            ("dead" if dead else "queued", str(error), now if dead else now + delay, now, job["id"]),
+        )
+    return "dead" if dead else "queued"
+
+def _owner_alive(locked_by):
+    host, _, pid = (locked_by or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_orphaned():
+    # Requeue running jobs whose worker process on this host is gone, or whose
+    # lease expired (covers workers on other hosts). Attempts already spent count.
+    now = time.time()
+    recovered = []
+    with db.unit_of_work() as conn:
+        rows = conn.execute(
+            "SELECT id, locked_by, locked_at FROM question_jobs WHERE status = 'running'"
+        ).fetchall()
+        for row in rows:
+            alive = _owner_alive(row["locked_by"])
+            if alive is False or (row["locked_at"] or 0) < now - JOB_LEASE_SECS:
+                conn.execute(
+                    """
+                    UPDATE question_jobs
+                    SET status = 'queued', next_run_at = ?, locked_by = NULL,
+                        locked_at = NULL, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (now, now, row["id"]),
+                )
+                recovered.append(row["id"])
+    if recovered:
+        print(f"[JOBS] Requeued orphaned jobs: {recovered}", flush=True)
+    return recovered
@@ -0,0 +1,53 @@
+import time
+
+from db_manager import db
+
+COLUMNS = (
+    "created_at", "model", "purpose", "patient_id", "attempt", "ok", "streamed", "stopped_early",
+    "prompt_tokens", "prompt_eval_secs", "generated_tokens", "eval_secs", "first_token_secs",
+    "elapsed_secs", "error",
+)
+
+def append(call):
+    with db.get_conn() as conn:
+        conn.execute(
+            f"INSERT INTO llm_calls ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+            tuple(call.get(column) for column in COLUMNS),
+        )
+
+def summary(days, top_patients=20):
+    # Calls and tokens per (model, purpose), and the patients with the most tokens.
+    since = time.time() - days * 86400
+    with db.get_conn() as conn:
+        by_purpose = conn.execute(
+            """
+            SELECT model, purpose, COUNT(*) AS calls, SUM(1 - ok) AS failures,
+                   COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                   COALESCE(SUM(generated_tokens), 0) AS generated_tokens,
+                   SUM(elapsed_secs) AS elapsed_secs
+            FROM llm_calls
+            WHERE created_at >= ?
+            GROUP BY model, purpose
+            ORDER BY prompt_tokens + generated_tokens DESC
+            """,
+            (since,),
+        ).fetchall()
+        by_patient = conn.execute(
+            """
+            SELECT patient_id, COUNT(*) AS calls,
+                   COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                   COALESCE(SUM(generated_tokens), 0) AS generated_tokens,
+                   SUM(elapsed_secs) AS elapsed_secs
+            FROM llm_calls
+            WHERE created_at >= ? AND patient_id IS NOT NULL
+            GROUP BY patient_id
+            ORDER BY prompt_tokens + generated_tokens DESC
+            LIMIT ?
+            """,
+            (since, top_patients),
+        ).fetchall()
+    return {
+        "days": days,
+        "by_purpose": [dict(row) for row in by_purpose],
+        "top_patients": [dict(row) for row in by_patient],
+    }
@@ -0,0 +1,368 @@
+import json
+from datetime import datetime
+
+from db_manager import baselines
+from db_manager.features import pack_features, unpack_feature_matrix
+
+# Ordered schema changes applied on top of the base tables created by init_db().
+# Append new steps with the next version number; never edit or reorder applied ones.
+
+def _add_history_indexes(conn):
+    for table in ("cognitive_history", "question_history", "patient_image_summaries"):
+        conn.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_patient_date
+            ON {table} (patient_id, date DESC, id DESC)
+            """
+        )
+
+def _add_refresh_token_expiry_index(conn):
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at
+        ON refresh_tokens (expires_at)
+        """
+    )
+
+def _pack_cognitive_features(conn):
+    # One-shot rewrite of features_json text into packed float64 features_blob rows.
+    conn.create_function(
+        "pack_features_json",
+        1,
+        lambda text: pack_features(json.loads(text)),
+        deterministic=True,
+    )
+    conn.execute(
+        """
+        CREATE TABLE cognitive_history_packed (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT,
+            date TEXT NOT NULL,
+            features_blob BLOB NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO cognitive_history_packed (id, patient_id, date, features_blob)
+        SELECT id, patient_id, date, pack_features_json(features_json)
+        FROM cognitive_history
+        ORDER BY id
+        """
+    )
+    conn.execute("DROP TABLE cognitive_history")
+    conn.execute("ALTER TABLE cognitive_history_packed RENAME TO cognitive_history")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_cognitive_history_patient_date
+        ON cognitive_history (patient_id, date DESC, id DESC)
+        """
+    )
+
+def _add_image_summary_slots(conn):
+    # Dense per-patient slot numbers (0..n-1) plus a per-patient count let
+    # get_random_image_summaries pick uniform slots without sorting every row.
+    conn.execute("ALTER TABLE patient_image_summaries ADD COLUMN patient_slot INTEGER")
+    conn.execute("CREATE TEMP TABLE image_summary_ranks (id INTEGER PRIMARY KEY, slot INTEGER NOT NULL)")
+    conn.execute(
+        """
+        INSERT INTO image_summary_ranks (id, slot)
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY patient_id ORDER BY id) - 1
+        FROM patient_image_summaries
+        """
+    )
+    conn.execute(
+        """
+        UPDATE patient_image_summaries
+        SET patient_slot = (
+            SELECT slot FROM image_summary_ranks
+            WHERE image_summary_ranks.id = patient_image_summaries.id
+        )
+        """
+    )
+    conn.execute("DROP TABLE image_summary_ranks")
+    conn.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_patient_image_summaries_slot
+        ON patient_image_summaries (patient_id, patient_slot)
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_summary_counts (
+            patient_id TEXT PRIMARY KEY,
+            total INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO image_summary_counts (patient_id, total)
+        SELECT patient_id, COUNT(*) FROM patient_image_summaries GROUP BY patient_id
+        """
+    )
+
+def _add_export_watermarks(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS export_watermarks (
+            table_name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+
+def _add_cognitive_baselines(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cognitive_baselines (
+            patient_id TEXT PRIMARY KEY,
+            sessions INTEGER NOT NULL,
+            count_blob BLOB NOT NULL,
+            mean_blob BLOB NOT NULL,
+            m2_blob BLOB NOT NULL
+        )
+        """
+    )
+    window = baselines.BASELINE_WINDOW_SESSIONS
+    patient_ids = [
+        row[0] for row in conn.execute("SELECT DISTINCT patient_id FROM cognitive_history").fetchall()
+    ]
+    for patient_id in patient_ids:
+        blobs = [
+            row[0]
+            for row in conn.execute(
+                "SELECT features_blob FROM cognitive_history WHERE patient_id = ? ORDER BY id LIMIT ?",
+                (patient_id, window if window > 0 else -1),
+            ).fetchall()
+        ]
+        matrix, _ = unpack_feature_matrix(blobs)
+        conn.execute(
+            """
+            INSERT INTO cognitive_baselines (patient_id, sessions, count_blob, mean_blob, m2_blob)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (patient_id, *baselines.to_row(baselines.baseline_from_matrix(matrix))),
+        )
+
+def _add_question_jobs(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS question_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            next_run_at REAL NOT NULL,
+            locked_by TEXT,
+            locked_at REAL,
+            last_error TEXT,
+            result_json TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_question_jobs_status_next_run
+        ON question_jobs (status, next_run_at, id)
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_question_jobs_patient_status
+        ON question_jobs (patient_id, status)
+        """
+    )
+
+def _add_staged_questions(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS staged_questions (
+            patient_id TEXT PRIMARY KEY,
+            questions_json TEXT NOT NULL,
+            generated_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            name TEXT PRIMARY KEY,
+            cursor TEXT NOT NULL,
+            completed INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+
+def _add_image_summary_cache(conn):
+    # Summaries keyed by image content + model + prompt version. The 64-bit
+    # perceptual hash is also split into eight 8-bit bands so near-duplicates
+    # (within IMAGE_PHASH_MAX_DISTANCE < 8 bits) share at least one indexed band.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_summary_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sha256 TEXT NOT NULL,
+            phash INTEGER,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            last_hit_at REAL,
+            UNIQUE (sha256, model, prompt_version)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS image_summary_cache_bands (
+            band INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            cache_id INTEGER NOT NULL,
+            PRIMARY KEY (band, value, cache_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+def _add_cognitive_reports(conn):
+    # Latest generated report per (patient, period). history_id is the newest
+    # cognitive_history id it covered; a newer session makes the row stale.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cognitive_reports (
+            patient_id TEXT NOT NULL,
+            days INTEGER NOT NULL,
+            history_id INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            report TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (patient_id, days)
+        )
+        """
+    )
+
+def _add_llm_calls(conn):
+    # One row per LLM call, written only when LLM_CALLS_TABLE_ENABLED is set.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at REAL NOT NULL,
+            model TEXT NOT NULL,
+            purpose TEXT NOT NULL,
+            patient_id TEXT,
+            attempt INTEGER,
+            ok INTEGER NOT NULL,
+            streamed INTEGER NOT NULL,
+            stopped_early INTEGER NOT NULL,
+            prompt_tokens INTEGER,
+            prompt_eval_secs REAL,
+            generated_tokens INTEGER,
+            eval_secs REAL,
+            first_token_secs REAL,
+            elapsed_secs REAL NOT NULL,
+            error TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_patient ON llm_calls (patient_id, created_at)")
+
+def _add_idempotency_keys(conn):
+    # Idempotency-Key values seen on POST /process_patient_data. status_code and
+    # response_json stay NULL until a response is recorded for the stored session.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            patient_id TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            request_hash TEXT NOT NULL,
+            status_code INTEGER,
+            response_json TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (patient_id, idempotency_key)
+        )
+        """
+    )
+
+def _scope_image_summary_bands(conn):
+    # Near-duplicate matches are limited to the uploading patient's own images,
+    # so the band index is keyed by patient. Existing bands carry no patient and
+    # are dropped; their cache entries still serve exact (SHA-256) hits.
+    conn.execute("DROP TABLE IF EXISTS image_summary_cache_bands")
+    conn.execute(
+        """
+        CREATE TABLE image_summary_cache_bands (
+            patient_id TEXT NOT NULL,
+            band INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            cache_id INTEGER NOT NULL,
+            PRIMARY KEY (patient_id, band, value, cache_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+MIGRATIONS = [
+    (1, "history_patient_date_indexes", _add_history_indexes),
+    (2, "refresh_tokens_expires_at_index", _add_refresh_token_expiry_index),
+    (3, "cognitive_history_packed_features", _pack_cognitive_features),
+    (4, "image_summary_sampling_slots", _add_image_summary_slots),
+    (5, "export_watermarks", _add_export_watermarks),
+    (6, "cognitive_baselines", _add_cognitive_baselines),
+    (7, "question_jobs", _add_question_jobs),
+    (8, "staged_questions", _add_staged_questions),
+    (9, "image_summary_cache", _add_image_summary_cache),
+    (10, "cognitive_reports", _add_cognitive_reports),
+    (11, "llm_calls", _add_llm_calls),
+    (12, "idempotency_keys", _add_idempotency_keys),
+    (13, "image_summary_bands_per_patient", _scope_image_summary_bands),
+]
+
+def _ensure_version_table(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+
+def current_version(conn):
+    _ensure_version_table(conn)
+    row = conn.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+    return row[0] or 0
+
+def run_migrations(conn):
+    applied = []
+    known = current_version(conn)
+    for version, name, step in MIGRATIONS:
+        if known >= version:
+            continue
+        # Each step runs in its own write transaction so concurrent workers starting
+        # up together apply it exactly once, and a failed step leaves no partial DDL.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"Applied schema migration {version}: {name}.")
+    return applied
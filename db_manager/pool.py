@@ -0,0 +1,78 @@
+import queue
+import sqlite3
+import threading
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+}
+
+class ConnectionPool:
+    # Keeps up to max_idle configured connections around so each request reuses
+    # an already-open, already-tuned handle instead of reconnecting per query.
+    def __init__(self, db_path, max_idle=8, busy_timeout_ms=5000, cache_size_kb=16384, mmap_size=268435456, on_connect=None):
+        self.db_path = db_path
+        self.on_connect = on_connect
+        self.max_idle = max_idle
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _configure(self, conn):
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        for name, value in DEFAULT_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        self._configure(conn)
+        with self._lock:
+            self._opened += 1
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {
+            "db_path": self.db_path,
+            "opened": self._opened,
+            "idle": self._idle.qsize(),
+            "max_idle": self.max_idle,
+        }
@@ -1,11 +1,18 @@
-import ollama
 import os
 import time
 import traceback
 
+from dotenv import load_dotenv
+
+from llm import client as llm_client
+from llm import telemetry
+
+load_dotenv()
+
 PROMPTS_DIR = os.path.join(os.path.dirname(__file__), 'prompts')
 QUESTION_COUNT = 5
 QUESTION_GENERATION_MAX_ATTEMPTS = 3
+QUESTION_STREAMING = os.getenv('QUESTION_STREAMING', 'true').lower() in ('1', 'true', 'yes')
 
 def load_prompt(prompt_name, **kwargs):
     prompt_path = os.path.join(PROMPTS_DIR, prompt_name)
@@ -16,7 +23,7 @@ def load_prompt(prompt_name, **kwargs):
         raise FileNotFoundError(f'Missing prompt file: {prompt_path}') from exc
     return template.format(**kwargs)
 
-def chat(prompt=None, model='mixtral', verbose=True, messages=None):
+def chat(prompt=None, model='mixtral', verbose=True, messages=None, purpose='chat', patient_id=None, attempt=None):
     if verbose:
         print(f'[LLM] Sending prompt to model={model}...', flush=True)
     started_at = time.perf_counter()
@@ -28,22 +35,118 @@ def chat(prompt=None, model='mixtral', verbose=True, messages=None):
             'content': prompt
         }]
     try:
-        response = ollama.chat(
+        response = llm_client.chat(
             model=model,
             messages=messages
         )
     except Exception as exc:
         elapsed = time.perf_counter() - started_at
+        telemetry.record(model, purpose, {'elapsed_secs': elapsed}, patient_id=patient_id, attempt=attempt, error=exc)
         if verbose:
             print(f'[LLM] Request failed after {elapsed:.2f}s: {exc}', flush=True)
             print(traceback.format_exc(), flush=True)
         raise
 
     elapsed = time.perf_counter() - started_at
+    stats = {'elapsed_secs': elapsed, **telemetry.response_counters(response)}
+    telemetry.record(model, purpose, stats, patient_id=patient_id, attempt=attempt)
     if verbose:
-        print(f'[LLM] Response obtained in {elapsed:.2f}s.', flush=True)
+        print(f'[LLM] Response obtained in {elapsed:.2f}s{_token_summary(stats)}.', flush=True)
     return response['message']['content']
 
+def _token_summary(stats):
+    summary = ''
+    if stats.get('prompt_eval_secs') is not None:
+        summary += f", prompt eval {stats['prompt_eval_count']} tokens in {stats['prompt_eval_secs']:.2f}s"
+    if stats.get('eval_secs'):
+        summary += f", generated {stats['eval_count']} tokens at {stats['eval_count'] / stats['eval_secs']:.1f} tok/s"
+    return summary
+
+def chat_stream(prompt=None, model='mixtral', verbose=True, messages=None, on_line=None,
+                purpose='chat', patient_id=None, attempt=None):
+    # Streams the completion and hands each finished line to on_line(line). If it
+    # returns 'stop' or an abort reason string, the stream is closed, which makes
+    # Ollama stop generating. Returns (content, stats).
+    if verbose:
+        print(f'[LLM] Streaming prompt to model={model}...', flush=True)
+    started_at = time.perf_counter()
+    if messages is None:
+        if prompt is None:
+            raise ValueError('Either prompt or messages must be provided.')
+        messages = [{
+            'role': 'user',
+            'content': prompt
+        }]
+    stats = {
+        'first_token_secs': None,
+        'first_line_secs': None,
+        'elapsed_secs': None,
+        'prompt_eval_count': None,
+        'prompt_eval_secs': None,
+        'eval_count': None,
+        'eval_secs': None,
+        'stopped_early': False,
+        'aborted': None,
+    }
+    content = ''
+    pending = ''
+    stream = None
+
+    def handle(line):
+        if stats['first_line_secs'] is None and line.strip():
+            stats['first_line_secs'] = time.perf_counter() - started_at
+        return on_line(line) if on_line else None
+
+    try:
+        stream = llm_client.chat(model=model, messages=messages, stream=True)
+        verdict = None
+        for chunk in stream:
+            if stats['first_token_secs'] is None:
+                # Until the first token arrives Ollama is evaluating the prompt.
+                stats['first_token_secs'] = time.perf_counter() - started_at
+            if chunk.get('done'):
+                stats.update(telemetry.response_counters(chunk))
+            piece = chunk['message']['content']
+            content += piece
+            pending += piece
+            while '\n' in pending and verdict is None:
+                line, pending = pending.split('\n', 1)
+                verdict = handle(line)
+            if verdict is not None:
+                stats['stopped_early'] = verdict == 'stop'
+                break
+        if verdict is None and pending:
+            verdict = handle(pending)
+        if verdict not in (None, 'stop'):
+            stats['aborted'] = verdict
+    except Exception as exc:
+        elapsed = time.perf_counter() - started_at
+        telemetry.record(
+            model, purpose, {**stats, 'elapsed_secs': elapsed},
+            patient_id=patient_id, attempt=attempt, streamed=True, error=exc,
+        )
+        if verbose:
+            print(f'[LLM] Streaming request failed after {elapsed:.2f}s: {exc}', flush=True)
+            print(traceback.format_exc(), flush=True)
+        raise
+    finally:
+        if stream is not None and hasattr(stream, 'close'):
+            stream.close()
+
+    stats['elapsed_secs'] = time.perf_counter() - started_at
+    telemetry.record(model, purpose, stats, patient_id=patient_id, attempt=attempt, streamed=True)
+    if verbose:
+        def secs(value):
+            return 'n/a' if value is None else f'{value:.2f}s'
+        print(
+            f"[LLM] Stream finished in {stats['elapsed_secs']:.2f}s "
+            f"(first token {secs(stats['first_token_secs'])}, first line {secs(stats['first_line_secs'])}"
+            f"{', stopped early' if stats['stopped_early'] else ''}"
+            f"{', aborted: ' + stats['aborted'] if stats['aborted'] else ''}){_token_summary(stats)}.",
+            flush=True,
+        )
+    return content, stats
+
 def _normalize_question_line(line):
     return line.lstrip(" -*\t0123456789.)(").strip()
 
@@ -60,10 +163,82 @@ def _validate_questions(questions):
     lowered = [question.casefold() for question in questions]
     return len(set(lowered)) == len(lowered)
 
-def _build_question_retry_messages(patient_data, invalid_response):
+def _looks_like_question(question):
+    # Preambles and commentary without a trailing colon ("Here are five questions
+    # for Margaret.") must not take a question's place.
+    return question.rstrip('"\'”’)*_ ').endswith('?')
+
+def _is_question_candidate(line):
+    # Checked before the screen, so only real questions can be accepted and kept
+    # across attempts; think tags and preambles are never questions.
+    return '<think>' not in line and '</think>' not in line and _looks_like_question(line)
+
+class _QuestionStreamChecker:
+    # Collects question lines as they stream in; other lines are skipped and never
+    # counted. Stops once `count` distinct questions are in and aborts on output
+    # that is clearly not a question list.
+    def __init__(self, count=QUESTION_COUNT):
+        self.count = count
+        self.questions = []
+        self.seen = set()
+        self.first_question_at = None
+
+    def __call__(self, line):
+        stripped = line.strip()
+        if '<think>' in stripped or '</think>' in stripped:
+            return 'think block'
+        question = _normalize_question_line(line)
+        if not question:
+            return None
+        if question.endswith(':'):
+            # A lead-in ("Here are your questions:") is skipped; one after questions is commentary.
+            return 'preamble or commentary' if self.questions else None
+        if not _looks_like_question(question) or question.casefold() in self.seen:
+            return None
+        if self.first_question_at is None:
+            self.first_question_at = time.perf_counter()
+        self.questions.append(question)
+        self.seen.add(question.casefold())
+        return 'stop' if len(self.questions) >= self.count else None
+
+def _generate_question_response(model, prompt=None, messages=None, count=QUESTION_COUNT, patient_id=None, attempt=None):
+    call_info = {'purpose': 'questions', 'patient_id': patient_id, 'attempt': attempt}
+    if not QUESTION_STREAMING:
+        return chat(prompt=prompt, model=model, messages=messages, **call_info)
+
+    started_at = time.perf_counter()
+    checker = _QuestionStreamChecker(count)
+    response, stats = chat_stream(prompt=prompt, model=model, messages=messages, on_line=checker, **call_info)
+    first_question = (
+        f'{checker.first_question_at - started_at:.2f}s' if checker.first_question_at is not None else 'n/a'
+    )
+    print(
+        f"[LLM] Question stream: time to first question {first_question}, "
+        f"total {stats['elapsed_secs']:.2f}s.",
+        flush=True,
+    )
+    if stats['aborted']:
+        print(f"[LLM] Aborted question stream early: {stats['aborted']}.", flush=True)
+    elif stats['stopped_early']:
+        # Anything after the last needed question is not used; drop it.
+        response = '\n'.join(checker.questions)
+    return response
+
+def _lexical_screen(candidates, accepted):
+    seen = {question.casefold() for question in accepted}
+    novel, rejected = [], []
+    for question in candidates:
+        if question.casefold() in seen:
+            rejected.append(question)
+        else:
+            seen.add(question.casefold())
+            novel.append(question)
+    return novel, rejected
+
+def _build_question_retry_messages(patient_context, invalid_response):
     base_prompt = load_prompt(
         'question_generation.txt',
-        patient_data=patient_data,
+        patient_data=patient_context,
         question_count=QUESTION_COUNT,
     )
     retry_prompt = load_prompt(
@@ -77,73 +252,128 @@ def _build_question_retry_messages(patient_data, invalid_response):
         {'role': 'user', 'content': retry_prompt},
     ]
 
-def new_questions(patient_data, model='mixtral'):
+def _build_question_partial_messages(patient_context, accepted, rejected):
+    base_prompt = load_prompt(
+        'question_generation.txt',
+        patient_data=patient_context,
+        question_count=QUESTION_COUNT,
+    )
+    partial_prompt = load_prompt(
+        'question_generation_partial.txt',
+        accepted_questions='\n'.join(accepted),
+        rejected_questions='\n'.join(rejected) or '(none)',
+        missing_count=QUESTION_COUNT - len(accepted),
+    )
+    return [
+        {'role': 'user', 'content': base_prompt},
+        {'role': 'assistant', 'content': '\n'.join(accepted)},
+        {'role': 'user', 'content': partial_prompt},
+    ]
+
+def new_questions(patient_data, model='mixtral', patient_context=None, screen=None):
+    # patient_context is the text placed in the prompt; defaults to the dict itself.
+    # screen(candidates, accepted) -> (novel, rejected) filters parsed questions; good
+    # ones are kept across attempts and only the missing count is asked for again.
+    if patient_context is None:
+        patient_context = patient_data
+    screen = screen or _lexical_screen
     prompt = load_prompt(
         'question_generation.txt',
-        patient_data=patient_data,
+        patient_data=patient_context,
         question_count=QUESTION_COUNT,
     )
-    print(f"[LLM] Generating new questions for patient_id={patient_data.get('id')}", flush=True)
+    patient_id = patient_data.get('id')
+    print(f"[LLM] Generating new questions for patient_id={patient_id}", flush=True)
     raw_outputs = []
+    accepted = []
+    rejected = []
 
     for attempt in range(1, QUESTION_GENERATION_MAX_ATTEMPTS + 1):
+        missing = QUESTION_COUNT - len(accepted)
         if attempt == 1:
-            response = chat(prompt=prompt, model=model)
+            response = _generate_question_response(model, prompt=prompt, patient_id=patient_id, attempt=attempt)
+        elif accepted:
+            print(
+                f'[LLM] Requesting {missing} more question(s), attempt {attempt}/{QUESTION_GENERATION_MAX_ATTEMPTS}.',
+                flush=True,
+            )
+            response = _generate_question_response(
+                model,
+                messages=_build_question_partial_messages(patient_context, accepted, rejected),
+                count=missing,
+                patient_id=patient_id,
+                attempt=attempt,
+            )
         else:
             print(
                 f'[LLM] Retrying question generation attempt {attempt}/{QUESTION_GENERATION_MAX_ATTEMPTS}.',
                 flush=True,
             )
-            response = chat(
-                model=model,
-                messages=_build_question_retry_messages(patient_data, raw_outputs[-1]),
+            response = _generate_question_response(
+                model,
+                messages=_build_question_retry_messages(patient_context, raw_outputs[-1]),
+                patient_id=patient_id,
+                attempt=attempt,
             )
 
         raw_outputs.append(response)
-        questions = _parse_questions(response)
-        print(f'[LLM] Parsed {len(questions)} questions on attempt {attempt}.', flush=True)
+        candidates = [question for question in _parse_questions(response) if _is_question_candidate(question)]
+        novel, repeats = screen(candidates, accepted)
+        accepted.extend(novel[:missing])
+        rejected.extend(repeats)
+        print(
+            f'[LLM] Parsed {len(candidates)} questions on attempt {attempt}: '
+            f'{len(novel)} kept, {len(repeats)} rejected as repeats, {len(accepted)}/{QUESTION_COUNT} accepted.',
+            flush=True,
+        )
 
-        if _validate_questions(questions):
-            return questions
+        if _validate_questions(accepted):
+            return accepted
 
     raise ValueError(
         f'Failed to generate exactly {QUESTION_COUNT} unique questions after '
         f'{QUESTION_GENERATION_MAX_ATTEMPTS} attempts. Raw outputs: {raw_outputs}'
     )
 
-def summarize_image(image_path, model='gemma4:e4b', verbose=True):
+def summarize_image(image, model='gemma4:e4b', verbose=True, label=None, patient_id=None):
+    # image is a file path or the encoded image bytes.
     prompt = load_prompt('image_summary.txt')
+    if label is None:
+        label = os.path.basename(image) if isinstance(image, str) else f'{len(image)} bytes'
 
     if verbose:
         print(
-            f"[LLM] Summarizing image with model={model}, file={os.path.basename(image_path)}...",
+            f"[LLM] Summarizing image with model={model}, file={label}...",
             flush=True,
         )
 
     started_at = time.perf_counter()
     try:
-        response = ollama.chat(
+        response = llm_client.chat(
             model=model,
             messages=[{
                 'role': 'user',
                 'content': prompt,
-                'images': [image_path],
+                'images': [image],
             }]
         )
     except Exception as exc:
         elapsed = time.perf_counter() - started_at
+        telemetry.record(model, 'image_summary', {'elapsed_secs': elapsed}, patient_id=patient_id, error=exc)
         if verbose:
             print(f'[LLM] Image summarization failed after {elapsed:.2f}s: {exc}', flush=True)
             print(traceback.format_exc(), flush=True)
         raise
 
     elapsed = time.perf_counter() - started_at
+    stats = {'elapsed_secs': elapsed, **telemetry.response_counters(response)}
+    telemetry.record(model, 'image_summary', stats, patient_id=patient_id)
     summary = response['message']['content'].strip()
     if verbose:
-        print(f'[LLM] Image summary obtained in {elapsed:.2f}s.', flush=True)
+        print(f'[LLM] Image summary obtained in {elapsed:.2f}s{_token_summary(stats)}.', flush=True)
     return summary
 
-def generate_report(patient_data, days=7, model='mixtral'):
+def generate_report(patient_data, days=7, model='mixtral', patient_id=None):
     prompt = load_prompt(
         'report_generation.txt',
         recent_cognitive_history=patient_data['recent_cognitive_history'],
@@ -154,5 +384,5 @@ def generate_report(patient_data, days=7, model='mixtral'):
         gender=patient_data['patient_info']['gender'][0].upper(),
         days=days,
     )
-    response = chat(prompt, model)
+    response = chat(prompt, model, purpose='report', patient_id=patient_id)
     return response.split('</think>')[-1]
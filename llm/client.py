@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+
+import httpx
+import ollama
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One shared LLM backend for the process. LLM_BACKEND=ollama (default) uses an
+# ollama.Client; LLM_BACKEND=stub uses llm/stub_backend.py for load tests. A backend
+# provides chat(model, messages, stream, keep_alive), generate(model, prompt,
+# keep_alive) and ps() with Ollama's response shapes. keep_alive is sent with every
+# request so a model stays resident between sessions instead of unloading after
+# Ollama's default five minutes; the warm-up loads models before the first request.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_TIMEOUT_SECS = float(os.getenv("OLLAMA_TIMEOUT_SECS", "600"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+OLLAMA_PS_CACHE_SECS = float(os.getenv("OLLAMA_PS_CACHE_SECS", "5"))
+
+_client = None
+_client_lock = threading.Lock()
+_warmup_state = {}
+_warming = set()
+_warming_lock = threading.Lock()
+_ps_cache = {"at": 0.0, "models": None}
+
+def _build_client():
+    if LLM_BACKEND == "stub":
+        from llm.stub_backend import StubBackend
+        print("[LLM] Using stub LLM backend", flush=True)
+        return StubBackend.from_env()
+    if LLM_BACKEND != "ollama":
+        raise RuntimeError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+    return ollama.Client(
+        host=OLLAMA_HOST,
+        timeout=OLLAMA_TIMEOUT_SECS,
+        limits=httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+        ),
+    )
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _build_client()
+        return _client
+
+def chat(**kwargs):
+    kwargs.setdefault("keep_alive", OLLAMA_KEEP_ALIVE)
+    return get_client().chat(**kwargs)
+
+def _model_key(model):
+    return model if ":" in model else f"{model}:latest"
+
+def warm_up(models):
+    # An empty prompt makes Ollama load the model without generating anything.
+    for model in models:
+        started_at = time.perf_counter()
+        _warmup_state[model] = {"status": "loading", "error": None}
+        try:
+            get_client().generate(model=model, prompt="", keep_alive=OLLAMA_KEEP_ALIVE)
+        except Exception as exc:
+            _warmup_state[model] = {"status": "failed", "error": str(exc)}
+            print(f"[LLM] Warm-up failed for model={model}: {exc}", flush=True)
+            continue
+        _warmup_state[model] = {"status": "loaded", "error": None}
+        print(f"[LLM] Warmed model={model} in {time.perf_counter() - started_at:.2f}s", flush=True)
+    _ps_cache["at"] = 0.0
+
+def start_warm_up(models):
+    # Single-flight per model: models already loading are not requested again.
+    with _warming_lock:
+        models = [model for model in models if model not in _warming]
+        _warming.update(models)
+    if not models:
+        return None
+
+    def run():
+        try:
+            warm_up(models)
+        finally:
+            with _warming_lock:
+                _warming.difference_update(models)
+
+    thread = threading.Thread(target=run, name="llm-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def resident_models():
+    # Models Ollama currently holds in memory; cached briefly so frequent readiness
+    # probes do not each hit the Ollama API.
+    now = time.monotonic()
+    if _ps_cache["models"] is not None and now - _ps_cache["at"] < OLLAMA_PS_CACHE_SECS:
+        return _ps_cache["models"]
+    response = get_client().ps()
+    models = {_model_key(model["model"]): model.get("expires_at") for model in response["models"]}
+    _ps_cache.update(at=now, models=models)
+    return models
+
+def readiness(models):
+    try:
+        resident = resident_models()
+    except Exception as exc:
+        return {"ready": False, "error": f"Ollama unreachable: {exc}", "models": {}}
+    # Ollama unloads idle models after keep_alive; with no traffic while unready,
+    # nothing else would load them again, so the probe itself starts a warm-up.
+    missing = [model for model in models if _model_key(model) not in resident]
+    if missing:
+        start_warm_up(missing)
+    report = {}
+    for model in models:
+        expires_at = resident.get(_model_key(model))
+        report[model] = {
+            "resident": _model_key(model) in resident,
+            "expires_at": str(expires_at) if expires_at else None,
+            "warm_up": _warmup_state.get(model, {}).get("status"),
+        }
+    return {"ready": all(entry["resident"] for entry in report.values()), "models": report}
@@ -0,0 +1,103 @@
+import os
+import re
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from db_manager import db
+from db_manager.cache import LRUCache
+
+load_dotenv()
+
+# Screens generated questions against everything the patient has been asked
+# before, so near-duplicates are dropped locally and only the missing count is
+# regenerated. Uses the same sentence-transformers model as feature extraction;
+# without it, falls back to exact matching on normalised text.
+QUESTION_EMBEDDING_MODEL = os.getenv("QUESTION_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+QUESTION_SIMILARITY_THRESHOLD = float(os.getenv("QUESTION_SIMILARITY_THRESHOLD", "0.85"))
+QUESTION_INDEX_CACHE_SIZE = int(os.getenv("QUESTION_INDEX_CACHE_SIZE", "256"))
+
+_index_cache = LRUCache("question_embeddings", QUESTION_INDEX_CACHE_SIZE)
+_model = None
+_model_lock = threading.Lock()
+_model_unavailable = False
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", text.casefold()).split())
+
+def _embedding_model():
+    global _model, _model_unavailable
+    if _model is not None or _model_unavailable:
+        return _model
+    with _model_lock:
+        if _model is None and not _model_unavailable:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _model = SentenceTransformer(QUESTION_EMBEDDING_MODEL)
+            except Exception as exc:
+                _model_unavailable = True
+                print(f"[DEDUP] Embedding model unavailable, using exact matching: {exc}", flush=True)
+    return _model
+
+def embed(texts):
+    model = _embedding_model()
+    if model is None or not texts:
+        return None
+    return np.asarray(model.encode(list(texts), normalize_embeddings=True), dtype=np.float32)
+
+def _empty_index():
+    return {"last_id": 0, "keys": set(), "vectors": np.zeros((0, 0), dtype=np.float32)}
+
+def _extend(index, questions):
+    new = []
+    for question in questions:
+        key = _normalize(question)
+        if key and key not in index["keys"]:
+            index["keys"].add(key)
+            new.append(question)
+    vectors = embed(new)
+    if vectors is not None:
+        index["vectors"] = vectors if index["vectors"].size == 0 else np.vstack([index["vectors"], vectors])
+
+def patient_index(patient_id):
+    # Cached per patient and topped up with sessions added since it was built, so
+    # each question is embedded once per process.
+    index = _index_cache.get(patient_id, None) or _empty_index()
+    last_id, questions = db.get_asked_questions(patient_id, index["last_id"])
+    if questions or last_id != index["last_id"]:
+        index = {"last_id": last_id, "keys": set(index["keys"]), "vectors": index["vectors"]}
+        _extend(index, questions)
+    _index_cache.put(patient_id, index)
+    return index
+
+def filter_novel(patient_id, candidates, extra=()):
+    # Returns (novel, rejected). A candidate is rejected if it matches an earlier
+    # question, one in `extra` (already accepted or scheduled) or an earlier candidate.
+    index = patient_index(patient_id)
+    keys = set(index["keys"])
+    vectors = index["vectors"]
+    extra_vectors = embed(extra)
+    if extra_vectors is not None:
+        vectors = extra_vectors if vectors.size == 0 else np.vstack([vectors, extra_vectors])
+    keys.update(_normalize(question) for question in extra)
+
+    candidate_vectors = embed(candidates)
+    novel, rejected = [], []
+    for position, question in enumerate(candidates):
+        key = _normalize(question)
+        duplicate = not key or key in keys
+        if not duplicate and candidate_vectors is not None and vectors.size:
+            duplicate = float(np.max(vectors @ candidate_vectors[position])) >= QUESTION_SIMILARITY_THRESHOLD
+        if duplicate:
+            rejected.append(question)
+            continue
+        novel.append(question)
+        keys.add(key)
+        if candidate_vectors is not None:
+            row = candidate_vectors[position:position + 1]
+            vectors = row if vectors.size == 0 else np.vstack([vectors, row])
+    return novel, rejected
+
+def cache_stats():
+    return _index_cache.stats()
@@ -0,0 +1,121 @@
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from db_manager import image_cache
+from llm import chatbot
+
+load_dotenv()
+
+IMAGE_SUMMARY_CACHE_ENABLED = os.getenv("IMAGE_SUMMARY_CACHE_ENABLED", "true").lower() in ('1', 'true', 'yes')
+# Uploads are decoded and downscaled in memory before they reach the vision model;
+# the model resizes to its own input resolution anyway, so larger images only add
+# transfer and preprocessing time.
+IMAGE_SUMMARY_MAX_SIDE = int(os.getenv("IMAGE_SUMMARY_MAX_SIDE", "896"))
+IMAGE_SUMMARY_JPEG_QUALITY = int(os.getenv("IMAGE_SUMMARY_JPEG_QUALITY", "90"))
+IMAGE_SUMMARY_CONCURRENCY = int(os.getenv("IMAGE_SUMMARY_CONCURRENCY", "2"))
+IMAGE_PHASH_MIN_CONTRAST = 12
+
+_pillow_missing_logged = False
+
+def _pillow():
+    global _pillow_missing_logged
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        if not _pillow_missing_logged:
+            _pillow_missing_logged = True
+            print('[IMAGES] Pillow not installed; images are sent as uploaded and cached by exact match only', flush=True)
+        return None, None
+    return Image, ImageOps
+
+def prompt_version():
+    # Editing image_summary.txt changes the version, so old summaries stop matching.
+    return hashlib.sha256(chatbot.load_prompt('image_summary.txt').encode('utf-8')).hexdigest()[:12]
+
+def _dhash(image, Image):
+    # 64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail,
+    # which survive re-compression and resizing. Near-flat thumbnails (blank or
+    # very dark shots, noise) all hash to about zero, so they get no hash at all.
+    pixels = image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    if max(pixels) - min(pixels) < IMAGE_PHASH_MIN_CONTRAST:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def prepare_image(data, label='image'):
+    # Returns (bytes for the model, perceptual hash). Falls back to the original
+    # bytes and no hash when Pillow is missing or cannot decode the file.
+    Image, ImageOps = _pillow()
+    if Image is None:
+        return data, None
+    try:
+        with Image.open(io.BytesIO(data)) as opened:
+            rotated = opened.getexif().get(0x0112, 1) not in (None, 1)
+            image = ImageOps.exif_transpose(opened) if rotated else opened
+            phash = _dhash(image, Image)
+            if not rotated and max(image.size) <= IMAGE_SUMMARY_MAX_SIDE and opened.format in ('JPEG', 'PNG'):
+                return data, phash
+            image.thumbnail((IMAGE_SUMMARY_MAX_SIDE, IMAGE_SUMMARY_MAX_SIDE), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.convert('RGB').save(output, 'JPEG', quality=IMAGE_SUMMARY_JPEG_QUALITY)
+            return output.getvalue(), phash
+    except Exception as exc:
+        print(f'[IMAGES] Could not decode {label}, sending it unchanged: {exc}', flush=True)
+        return data, None
+
+def _log_hit(hit, label):
+    print(
+        f"[IMAGES] Summary cache {hit['match']} hit for {label} "
+        f"(cache_id={hit['cache_id']}{', distance=' + str(hit['distance']) if 'distance' in hit else ''})",
+        flush=True,
+    )
+
+def summarize(data, model, label='image', patient_id=None):
+    # Returns (summary, cache_match) where cache_match is 'exact', 'near' or None.
+    if not IMAGE_SUMMARY_CACHE_ENABLED:
+        model_bytes, _ = prepare_image(data, label)
+        return chatbot.summarize_image(model_bytes, model=model, label=label, patient_id=patient_id), None
+
+    # Exact hits only need a hash of the raw bytes; the image is decoded only
+    # for the near-duplicate lookup and the model call.
+    version = prompt_version()
+    sha256 = hashlib.sha256(data).hexdigest()
+    hit = image_cache.lookup_exact(sha256, model, version)
+    if hit is not None:
+        _log_hit(hit, label)
+        return hit['summary'], hit['match']
+
+    model_bytes, phash = prepare_image(data, label)
+    hit = image_cache.lookup_near(phash, model, version, patient_id)
+    if hit is not None:
+        _log_hit(hit, label)
+        # Remember this exact file too, so the next upload of it is an exact hit.
+        image_cache.store(sha256, phash, model, version, hit['summary'], patient_id=patient_id)
+        return hit['summary'], hit['match']
+
+    summary = chatbot.summarize_image(model_bytes, model=model, label=label, patient_id=patient_id)
+    image_cache.store(sha256, phash, model, version, summary, patient_id=patient_id)
+    return summary, None
+
+def summarize_uploads(uploads, model, concurrency=None, patient_id=None):
+    # uploads is a list of (filename, readable stream). Each file is read inside its
+    # worker, so at most `concurrency` images are held in memory at once. Returns
+    # (filename, summary, cache_match, error) tuples in upload order.
+    def run(upload):
+        filename, stream = upload
+        try:
+            summary, cache_match = summarize(stream.read(), model, label=filename, patient_id=patient_id)
+            return filename, summary, cache_match, None
+        except Exception as exc:
+            return filename, None, None, exc
+
+    workers = max(1, min(concurrency or IMAGE_SUMMARY_CONCURRENCY, len(uploads)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-summary') as pool:
+        return list(pool.map(run, uploads))
@@ -0,0 +1,81 @@
+import threading
+import traceback
+
+from db_manager import jobs
+
+
+class PermanentJobError(Exception):
+    # Raised by a handler when retrying cannot help (e.g. the patient was deleted).
+    pass
+
+
+class QuestionJobWorkers:
+    # Background threads that claim queued jobs and run handler(job) -> result.
+    # Failures are retried with backoff by jobs.fail(); wake() skips the poll wait
+    # after an enqueue so fresh jobs start immediately. Database errors in the loop
+    # are logged and retried after error_backoff; they never end a worker thread.
+    def __init__(self, handler, workers=2, poll_interval=2.0, error_backoff=5.0):
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.error_backoff = error_backoff
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        try:
+            jobs.recover_orphaned()
+        except Exception as exc:
+            # The workers' idle polls retry recovery.
+            print(f"[JOBS] Failed to recover orphaned jobs: {exc}", flush=True)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"question-job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def _run(self):
+        polls = 0
+        while not self._stop_event.is_set():
+            try:
+                job = jobs.claim_next()
+                if job is None:
+                    polls += 1
+                    # Orphan checks are cheap but need not run on every idle poll.
+                    if polls % 30 == 0:
+                        jobs.recover_orphaned()
+                    self._wake_event.wait(self.poll_interval)
+                    self._wake_event.clear()
+                    continue
+
+                self._execute(job)
+            except Exception as exc:
+                # e.g. "database is locked" while claiming or recording a result. A job
+                # left running is requeued by recover_orphaned once its lease expires.
+                print(f"[JOBS] Worker loop error: {exc}", flush=True)
+                print(traceback.format_exc(), flush=True)
+                self._stop_event.wait(self.error_backoff)
+
+    def _execute(self, job):
+        print(
+            f"[JOBS] Running job {job['id']} ({job['kind']}) for patient_id={job['patient_id']}, "
+            f"attempt {job['attempts']}/{job['max_attempts']}",
+            flush=True,
+        )
+        try:
+            result = self.handler(job)
+        except Exception as exc:
+            status = jobs.fail(job, exc, permanent=isinstance(exc, PermanentJobError))
+            print(f"[JOBS] Job {job['id']} failed ({status}): {exc}", flush=True)
+            print(traceback.format_exc(), flush=True)
+            return
+        jobs.complete(job["id"], result)
+        print(f"[JOBS] Job {job['id']} succeeded.", flush=True)
@@ -0,0 +1,117 @@
+# Off-peak pre-generation of next question sets for every patient.
+# Usage: python -m llm.pregenerate [--budget-mins 240] [--concurrency 1] [--restart]
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from db_manager import db
+from llm.questions import prep_next_questions
+
+load_dotenv()
+
+SCHEDULER_NAME = "pregenerate_questions"
+PREGEN_CONCURRENCY = int(os.getenv("PREGEN_OLLAMA_CONCURRENCY", "1"))
+PREGEN_TIME_BUDGET_MINS = float(os.getenv("PREGEN_TIME_BUDGET_MINS", "240"))
+PREGEN_HOUR = int(os.getenv("PREGEN_HOUR", "2"))
+STAGED_QUESTIONS_MAX_AGE_SECS = float(os.getenv("STAGED_QUESTIONS_MAX_AGE_HOURS", "24")) * 3600
+
+def stage_for_patient(patient_id):
+    patient = db.get_patient_profile(patient_id)
+    if not patient:
+        return False
+    # The pending set will be asked before the staged one, so it must not be repeated.
+    patient["scheduled_questions"] = db.get_next_questions(patient_id)
+    db.stage_questions(patient_id, prep_next_questions(patient))
+    return True
+
+def run_batch(time_budget_secs=None, concurrency=None, restart=False):
+    # Walks patients in id order, staging any whose set is missing or stale. No new
+    # generation starts once the budget is spent; the ones running are allowed to
+    # finish. The cursor is saved after every page, so a run cut off by its budget
+    # (or a crash) resumes where it stopped; it restarts from the beginning once a
+    # full pass completes.
+    time_budget_secs = PREGEN_TIME_BUDGET_MINS * 60 if time_budget_secs is None else time_budget_secs
+    concurrency = concurrency or PREGEN_CONCURRENCY
+    deadline = time.monotonic() + time_budget_secs
+
+    state = db.get_scheduler_state(SCHEDULER_NAME)
+    cursor = state["cursor"] if state and not state["completed"] and not restart else ""
+    stats = {"staged": 0, "failed": 0, "completed": False, "resumed_from": cursor or None}
+    print(f"[PREGEN] Starting batch (cursor={cursor or 'start'}, concurrency={concurrency})", flush=True)
+
+    def collect(done):
+        for future in done:
+            try:
+                if future.result():
+                    stats["staged"] += 1
+            except Exception as exc:
+                stats["failed"] += 1
+                print(f"[PREGEN] Failed for patient_id={pending[future]}: {exc}", flush=True)
+            del pending[future]
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while time.monotonic() < deadline:
+            patient_ids = db.get_patients_needing_staging(cursor, concurrency * 4, STAGED_QUESTIONS_MAX_AGE_SECS)
+            if not patient_ids:
+                stats["completed"] = True
+                break
+
+            submitted = []
+            for patient_id in patient_ids:
+                if len(pending) >= concurrency:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+                if time.monotonic() >= deadline:
+                    break
+                pending[pool.submit(stage_for_patient, patient_id)] = patient_id
+                submitted.append(patient_id)
+            collect(wait(pending).done)
+
+            if submitted:
+                cursor = submitted[-1]
+                db.set_scheduler_state(SCHEDULER_NAME, cursor, completed=False)
+
+    db.set_scheduler_state(SCHEDULER_NAME, "" if stats["completed"] else cursor, completed=stats["completed"])
+    print(
+        f"[PREGEN] Batch {'completed' if stats['completed'] else 'paused at ' + (cursor or 'start')}: "
+        f"{stats['staged']} staged, {stats['failed']} failed",
+        flush=True,
+    )
+    return stats
+
+def _seconds_until(hour):
+    now = datetime.now()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+def start_nightly_scheduler(hour=PREGEN_HOUR):
+    stop_event = threading.Event()
+
+    def run():
+        while not stop_event.wait(_seconds_until(hour)):
+            try:
+                run_batch()
+            except Exception as exc:
+                print(f"[PREGEN] Batch failed: {exc}", flush=True)
+
+    thread = threading.Thread(target=run, name="question-pregenerator", daemon=True)
+    thread.start()
+    return stop_event
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate next question sets for all patients.")
+    parser.add_argument("--budget-mins", type=float, default=PREGEN_TIME_BUDGET_MINS)
+    parser.add_argument("--concurrency", type=int, default=PREGEN_CONCURRENCY)
+    parser.add_argument("--restart", action="store_true", help="Ignore a saved cursor and start from the first patient.")
+    args = parser.parse_args()
+    run_batch(time_budget_secs=args.budget_mins * 60, concurrency=args.concurrency, restart=args.restart)
+
+if __name__ == "__main__":
+    main()
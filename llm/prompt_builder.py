@@ -0,0 +1,167 @@
+import math
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+from db_manager import baselines, db
+from llm import chatbot
+
+load_dotenv()
+
+# Compact, token-budgeted patient context for question generation. Sections are
+# added in priority order and the previously-asked list fills whatever is left,
+# so prompt size stays flat however long a patient has been enrolled.
+QUESTION_PROMPT_TOKEN_BUDGET = int(os.getenv('QUESTION_PROMPT_TOKEN_BUDGET', '1500'))
+PROMPT_RECENT_SESSIONS = int(os.getenv('PROMPT_RECENT_SESSIONS', '2'))
+PROMPT_TREND_WINDOW = int(os.getenv('PROMPT_TREND_WINDOW', '10'))
+PROMPT_TREND_FEATURES = int(os.getenv('PROMPT_TREND_FEATURES', '8'))
+PROMPT_QUESTION_HISTORY_SESSIONS = int(os.getenv('PROMPT_QUESTION_HISTORY_SESSIONS', '200'))
+
+# Rough estimate for Llama-family tokenizers on English text; no tokenizer is loaded.
+CHARS_PER_TOKEN = 4
+ANSWER_MAX_CHARS = 160
+SUMMARY_MAX_CHARS = 240
+DESCRIPTION_MAX_CHARS = 400
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _clip(text, max_chars):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + '...'
+
+def _fmt(value):
+    return 'n/a' if value is None or not np.isfinite(value) else f'{value:.3g}'
+
+def _profile_lines(patient):
+    parts = [patient.get('full_name') or patient.get('first_name') or patient.get('id')]
+    if patient.get('first_name'):
+        parts.append(f"goes by {patient['first_name']}")
+    if patient.get('age'):
+        parts.append(f"age {patient['age']}")
+    if patient.get('gender'):
+        parts.append(str(patient['gender']))
+    lines = ['Patient: ' + ', '.join(str(part) for part in parts)]
+    if patient.get('description'):
+        lines.append('About: ' + _clip(patient['description'], DESCRIPTION_MAX_CHARS))
+    return lines
+
+def _trend_lines(patient_id):
+    # One line per feature index: latest value, running baseline, z-score and the
+    # direction over the last PROMPT_TREND_WINDOW sessions. Most changed first.
+    dates, matrix = db.get_cognitive_feature_matrix(patient_id, PROMPT_TREND_WINDOW)
+    if not dates:
+        return None, []
+    # Scored against the baseline without the latest session (see get_latest_session_baseline).
+    _, _, baseline = db.get_latest_session_baseline(patient_id)
+    std = baselines.std(baseline)
+    latest = matrix[0]
+    z_scores = baselines.z_scores(baseline, latest)
+
+    rows = []
+    window = matrix[::-1]
+    for index in range(matrix.shape[1]):
+        column = window[:, index]
+        finite = np.isfinite(column)
+        direction = 'steady'
+        scale = std[index] if index < std.size and std[index] > 0 else None
+        if finite.sum() >= 3 and scale:
+            slope = np.polyfit(np.flatnonzero(finite), column[finite], 1)[0]
+            change = slope * (finite.sum() - 1) / scale
+            if change > 0.5:
+                direction = 'rising'
+            elif change < -0.5:
+                direction = 'falling'
+        z = z_scores[index] if index < len(z_scores) else None
+        mean = baseline['mean'][index] if index < baseline['mean'].size else None
+        rows.append((
+            abs(z) if z is not None else 0.0,
+            f"f{index}: latest {_fmt(latest[index])}, baseline {_fmt(mean)}"
+            f"{'' if scale is None else ' +/- ' + _fmt(scale)}, z {_fmt(z)}, {direction}",
+        ))
+
+    rows.sort(key=lambda row: row[0], reverse=True)
+    header = f'Speech features over the last {len(dates)} sessions ({dates[-1]} to {dates[0]}), most changed first:'
+    return header, [line for _, line in rows[:PROMPT_TREND_FEATURES]]
+
+def _question_history(patient_id):
+    history = db.get_full_question_history(patient_id, PROMPT_QUESTION_HISTORY_SESSIONS)
+    recent = []
+    for entry in history[:PROMPT_RECENT_SESSIONS]:
+        recent.append(f"{entry['date']}:")
+        for pair in entry['qa']:
+            recent.append(f"- Q: {_clip(pair.get('q', ''), ANSWER_MAX_CHARS)} A: {_clip(pair.get('a', ''), ANSWER_MAX_CHARS)}")
+
+    seen = {
+        pair.get('q', '').strip().casefold()
+        for entry in history[:PROMPT_RECENT_SESSIONS]
+        for pair in entry['qa']
+    }
+    asked = []
+    for entry in history[PROMPT_RECENT_SESSIONS:]:
+        for pair in entry['qa']:
+            key = pair.get('q', '').strip().casefold()
+            if key and key not in seen:
+                seen.add(key)
+                asked.append('- ' + _clip(pair['q'], ANSWER_MAX_CHARS))
+    return recent, asked
+
+def _take(lines, budget, min_lines=0):
+    # Longest prefix of lines that fits in budget tokens (at least min_lines).
+    taken, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line + '\n')
+        if used + cost > budget and len(taken) >= min_lines:
+            break
+        taken.append(line)
+        used += cost
+    return taken, used
+
+def template_tokens():
+    return estimate_tokens(chatbot.load_prompt(
+        'question_generation.txt',
+        patient_data='',
+        question_count=chatbot.QUESTION_COUNT,
+    ))
+
+def build_patient_context(patient, token_budget=None, image_summaries=None, scheduled_questions=None):
+    token_budget = QUESTION_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    remaining = token_budget - template_tokens()
+    sections = {}
+
+    def add(name, lines, header=None, min_lines=0):
+        nonlocal remaining
+        if not lines:
+            return
+        if header:
+            lines = [header] + lines
+            min_lines += 1
+        taken, used = _take(lines, remaining, min_lines)
+        if taken and (not header or len(taken) > 1):
+            sections[name] = taken
+            remaining -= used
+
+    recent, asked = _question_history(patient['id'])
+
+    add('profile', _profile_lines(patient), min_lines=1)
+    add(
+        'scheduled',
+        ['- ' + question for question in scheduled_questions or []],
+        header='scheduled_questions (asked next session, do not repeat):',
+        min_lines=len(scheduled_questions or []),
+    )
+    add('recent', recent, header='recent_question_history (newest first):')
+    trend_header, trend_lines = _trend_lines(patient['id'])
+    add('trends', trend_lines, header=trend_header)
+    add(
+        'images',
+        ['- ' + _clip(summary, SUMMARY_MAX_CHARS) for summary in image_summaries or []],
+        header='image_summaries:',
+    )
+    add('asked', asked, header='question_history (asked before, do not repeat):')
+    if 'asked' in sections and len(sections['asked']) - 1 < len(asked):
+        sections['asked'].append(f"(+{len(asked) - len(sections['asked']) + 1} older questions omitted)")
+
+    order = ['profile', 'trends', 'recent', 'images', 'asked', 'scheduled']
+    return '\n\n'.join('\n'.join(sections[name]) for name in order if name in sections)
@@ -0,0 +1,87 @@
+import threading
+
+from db_manager import db
+from llm import chatbot, dedup, prompt_builder
+
+# Upgrade to llama3:70b once computing power is increased
+LLM_MODEL = 'llama3.1:8b'
+
+# Single-flight per (patient, latest session): concurrent callers for the same
+# session (a retried submission, a job worker racing the request) wait for one
+# generation instead of starting their own. A newer session starts its own
+# generation, and an older one finishing late never overwrites its questions.
+_inflight = {}
+_written = {}
+_lock = threading.Lock()
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.questions = None
+        self.error = None
+
+def prep_next_questions(patient_data, token_budget=None):
+    patient_id = patient_data["id"]
+    image_summaries = [entry["summary"] for entry in db.get_random_image_summaries(patient_id, 5)]
+    context = prompt_builder.build_patient_context(
+        patient_data,
+        token_budget=token_budget,
+        image_summaries=image_summaries,
+        scheduled_questions=patient_data.get("scheduled_questions"),
+    )
+    prompt_tokens = prompt_builder.template_tokens() + prompt_builder.estimate_tokens(context)
+    print(
+        f"[QUESTIONS] Preparing next questions for patient_id={patient_id} (prompt ~{prompt_tokens} tokens)",
+        flush=True,
+    )
+    scheduled = list(patient_data.get("scheduled_questions") or [])
+
+    def screen(candidates, accepted):
+        return dedup.filter_novel(patient_id, candidates, extra=scheduled + accepted)
+
+    qns = chatbot.new_questions(patient_data, model=LLM_MODEL, patient_context=context, screen=screen)
+    if not isinstance(qns, list) or len(qns) != 5 or not all(isinstance(q, str) and q.strip() for q in qns):
+        raise ValueError(f"Expected 5 generated questions, got: {qns}")
+    print(f"[QUESTIONS] Generated and validated 5 questions for patient_id={patient_id}", flush=True)
+    return qns
+
+def store_next_questions(patient_id, history_id, questions):
+    # Every write of next_questions goes through here (generated or staged), so
+    # questions for an older session never replace those for a newer one.
+    with _lock:
+        if _written.get(patient_id, 0) > history_id:
+            print(f"[QUESTIONS] Newer questions already stored for patient_id={patient_id}; not overwriting", flush=True)
+            return False
+        db.update_next_questions(patient_id, questions)
+        _written[patient_id] = history_id
+        return True
+
+def generate_next_questions(patient_data):
+    # Generates and stores the patient's next questions; returns them.
+    patient_id = patient_data["id"]
+    history_id = db.get_latest_cognitive_history_id(patient_id) or 0
+    key = (patient_id, history_id)
+    with _lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = _Flight()
+
+    if not leader:
+        print(f"[QUESTIONS] Joining in-flight generation for patient_id={patient_id}", flush=True)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.questions
+
+    try:
+        flight.questions = prep_next_questions(patient_data)
+        store_next_questions(patient_id, history_id, flight.questions)
+        return flight.questions
+    except Exception as exc:
+        flight.error = exc
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        flight.done.set()
@@ -0,0 +1,98 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from db_manager import db
+from llm import chatbot
+from llm.questions import LLM_MODEL
+
+load_dotenv()
+
+# Caregiver reports are stored per (patient, days) together with the newest
+# cognitive_history id they covered, so they only go stale when a session arrives.
+# Misses are generated on a small background pool; concurrent requests for the
+# same (patient, days, history id) share one in-flight generation.
+REPORT_MODEL = os.getenv("REPORT_MODEL", LLM_MODEL)
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "1"))
+REPORT_SUMMARY_MONTHS = int(os.getenv("REPORT_SUMMARY_MONTHS", "12"))
+REPORT_MAX_QUESTION_SESSIONS = int(os.getenv("REPORT_MAX_QUESTION_SESSIONS", "20"))
+
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+_inflight = {}
+_failures = {}
+_lock = threading.Lock()
+
+def _vector(values):
+    return ", ".join("n/a" if value is None else f"{value:.3g}" for value in values)
+
+def build_report_inputs(patient, days):
+    patient_id = patient["id"]
+    since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    recent, _ = db.get_cognitive_history_range(patient_id, since=since)
+    summary_since = (datetime.now() - timedelta(days=31 * REPORT_SUMMARY_MONTHS)).strftime("%Y-%m-01")
+    monthly = db.get_monthly_cognitive_summary(patient_id, since=summary_since)
+    questions = [
+        entry for entry in db.get_full_question_history(patient_id, REPORT_MAX_QUESTION_SESSIONS)
+        if entry["date"] >= since
+    ]
+
+    return {
+        "recent_cognitive_history": "\n" + "\n".join(
+            f"{entry['date']}: {_vector(entry['features'])}" for entry in reversed(recent)
+        ),
+        "yearly_summary": "\n" + "\n".join(
+            f"{month['month']} ({month['sessions']} sessions): mean {_vector(month['mean'])}; "
+            f"std {_vector(month['std'])}"
+            for month in monthly
+        ),
+        "recent_question_history": "\n" + "\n".join(
+            f"{entry['date']}: Q: {pair.get('q', '')} A: {pair.get('a', '')}"
+            for entry in reversed(questions)
+            for pair in entry["qa"]
+        ),
+        "patient_info": {
+            "full_name": patient.get("full_name") or patient_id,
+            "age": patient.get("age") or "unknown",
+            "gender": patient.get("gender") or "unknown",
+        },
+    }
+
+def _generate(patient, days, history_id, key):
+    try:
+        print(f"[REPORT] Generating {days}-day report for patient_id={patient['id']}", flush=True)
+        report = chatbot.generate_report(
+            build_report_inputs(patient, days), days=days, model=REPORT_MODEL, patient_id=patient["id"]
+        )
+        db.store_cognitive_report(patient["id"], days, history_id, REPORT_MODEL, report.strip())
+    except Exception as exc:
+        print(f"[REPORT] Failed for patient_id={patient['id']}, days={days}: {exc}", flush=True)
+        with _lock:
+            _failures[key] = str(exc)
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+
+def get_report(patient, days):
+    # Returns (status, report_row, error). status is 'ready', 'pending', 'failed' or
+    # 'empty'. While pending, report_row is the previous (stale) report if any.
+    patient_id = patient["id"]
+    history_id = db.get_latest_cognitive_history_id(patient_id)
+    if history_id is None:
+        return "empty", None, None
+
+    cached = db.get_cognitive_report(patient_id, days)
+    if cached and cached["history_id"] == history_id:
+        return "ready", cached, None
+
+    key = (patient_id, days, history_id)
+    with _lock:
+        error = _failures.pop(key, None)
+        if error is not None:
+            # Reported once; the next request starts a fresh attempt.
+            return "failed", cached, error
+        if key not in _inflight:
+            _inflight[key] = _executor.submit(_generate, dict(patient), days, history_id, key)
+    return "pending", cached, None
@@ -0,0 +1,186 @@
+# Deterministic stand-in for Ollama, for load-testing the server without a model box.
+# In-process: set LLM_BACKEND=stub. Over HTTP (exercises the real Ollama client):
+#   python -m llm.stub_backend --port 11435   and run the app with OLLAMA_HOST=http://127.0.0.1:11435
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ollama
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOPICS = [
+    "breakfast this morning", "a walk this week", "a phone call with family", "your favourite teacher",
+    "your first home", "a childhood holiday", "a song you loved", "a birthday party", "your school friends",
+    "a family recipe", "a wedding you attended", "the garden", "a trip to the seaside", "a favourite pet",
+]
+OPENINGS = ["What do you remember about", "Can you tell me about", "Who was with you during", "How did you feel about"]
+
+def parse_latency(spec):
+    # "fixed:MS", "uniform:LOW:HIGH", "normal:MEAN:SD" or "lognormal:MEDIAN:SIGMA"; values in ms.
+    kind, *args = spec.split(":")
+    args = [float(arg) for arg in args]
+    if kind == "fixed" and len(args) == 1:
+        return lambda rng: args[0]
+    if kind == "uniform" and len(args) == 2:
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "normal" and len(args) == 2:
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == "lognormal" and len(args) == 2:
+        return lambda rng: args[0] * rng.lognormvariate(0.0, args[1])
+    raise ValueError(f"Unsupported latency spec: {spec}")
+
+class StubBackend:
+    # Implements the subset of ollama.Client used by llm/client.py: chat (optionally
+    # streamed), generate and ps. Question prompts get the requested number of unique
+    # questions, image prompts a summary, anything else a short Markdown report.
+    def __init__(self, chat_latency="fixed:0", vision_latency="fixed:0", failure_rate=0.0, seed=0):
+        self.chat_latency = parse_latency(chat_latency)
+        self.vision_latency = parse_latency(vision_latency)
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._models = set()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            chat_latency=os.getenv("LLM_STUB_LATENCY_MS", "fixed:0"),
+            vision_latency=os.getenv("LLM_STUB_VISION_LATENCY_MS", os.getenv("LLM_STUB_LATENCY_MS", "fixed:0")),
+            failure_rate=float(os.getenv("LLM_STUB_FAILURE_RATE", "0")),
+            seed=int(os.getenv("LLM_STUB_SEED", "0")),
+        )
+
+    def _draw(self, sampler):
+        with self._rng_lock:
+            return sampler(self._rng) / 1000, self._rng.random() < self.failure_rate, self._rng.random()
+
+    def _questions(self, count, salt):
+        questions = []
+        for _ in range(count):
+            number = next(self._counter)
+            opening = OPENINGS[int(salt * 1000 + number) % len(OPENINGS)]
+            topic = TOPICS[(number * 5) % len(TOPICS)]
+            questions.append(f"{opening} {topic} (memory {number})?")
+        return "\n".join(questions)
+
+    def _respond(self, messages):
+        last = messages[-1] if messages else {}
+        content = last.get("content", "") if isinstance(last, dict) else ""
+        is_vision = bool(isinstance(last, dict) and last.get("images"))
+        latency, fail, salt = self._draw(self.vision_latency if is_vision else self.chat_latency)
+        question_count = re.search(r"exactly (\d+)[^\n]*question", content)
+        if is_vision:
+            text = f"A photo with two people smiling outdoors near a house (stub summary {next(self._counter)})."
+        elif question_count:
+            text = self._questions(int(question_count.group(1)), salt)
+        else:
+            text = "# Neurolens Cognitive Report\n\n## Summary\nStub report: no notable change."
+        return text, latency, fail, len(content) // 4
+
+    def _counters(self, text, latency, prompt_tokens):
+        # Ollama's final-chunk counters: prompt evaluation takes 30% of the latency, generation the rest.
+        return {"prompt_eval_count": prompt_tokens, "prompt_eval_duration": int(latency * 0.3e9),
+                "eval_count": max(1, len(text) // 4), "eval_duration": int(latency * 0.7e9)}
+
+    def chat(self, model="", messages=None, stream=False, keep_alive=None, options=None, **kwargs):
+        self._models.add(model)
+        text, latency, fail, prompt_tokens = self._respond(list(messages or []))
+        if not stream:
+            time.sleep(latency)
+            if fail:
+                raise ollama.ResponseError("stub backend failure", 500)
+            return {"model": model, "message": {"role": "assistant", "content": text}, "done": True,
+                    **self._counters(text, latency, prompt_tokens)}
+        return self._stream(model, text, latency, fail, prompt_tokens)
+
+    def _stream(self, model, text, latency, fail, prompt_tokens):
+        # A third of the latency before the first token (prompt evaluation), the rest spread over words.
+        time.sleep(latency * 0.3)
+        if fail:
+            raise ollama.ResponseError("stub backend failure", 500)
+        words = re.findall(r"\S+\s*", text)
+        for word in words:
+            time.sleep(latency * 0.7 / max(len(words), 1))
+            yield {"model": model, "message": {"role": "assistant", "content": word}, "done": False}
+        yield {"model": model, "message": {"role": "assistant", "content": ""}, "done": True,
+               **self._counters(text, latency, prompt_tokens)}
+
+    def generate(self, model="", prompt="", keep_alive=None, options=None, **kwargs):
+        self._models.add(model)
+        return {"model": model, "response": "", "done": True}
+
+    def ps(self):
+        return {"models": [{"model": model if ":" in model else f"{model}:latest", "expires_at": None}
+                           for model in sorted(self._models)]}
+
+def serve(backend, host, port):
+    # Minimal Ollama-compatible HTTP API (/api/chat, /api/generate, /api/ps).
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/ps":
+                return self._send_json(200, backend.ps())
+            self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            try:
+                if self.path == "/api/generate":
+                    return self._send_json(200, backend.generate(model=request.get("model", "")))
+                if self.path != "/api/chat":
+                    return self._send_json(404, {"error": "not found"})
+                stream = request.get("stream", True)
+                result = backend.chat(model=request.get("model", ""), messages=request.get("messages"), stream=stream)
+                if not stream:
+                    return self._send_json(200, result)
+                chunks = iter(result)
+                first = next(chunks)
+            except ollama.ResponseError as exc:
+                return self._send_json(500, {"error": exc.error})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for chunk in itertools.chain([first], chunks):
+                    line = json.dumps(chunk).encode("utf-8") + b"\n"
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading (early stop/abort), like closing an Ollama stream.
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"[STUB] Serving stub Ollama API on http://{host}:{port}", flush=True)
+    server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the stub LLM backend over Ollama's HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    args = parser.parse_args()
+    serve(StubBackend.from_env(), args.host, args.port)
+
+if __name__ == "__main__":
+    main()
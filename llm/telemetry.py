@@ -0,0 +1,180 @@
+import bisect
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from db_manager import llm_calls
+
+load_dotenv()
+
+# Per-call LLM metrics from the counters Ollama returns with each response
+# (prompt_eval_count/duration, eval_count/duration). Calls are aggregated in
+# process into fixed-bucket histograms per (model, purpose) and token totals per
+# patient; with LLM_CALLS_TABLE_ENABLED each call is also written to llm_calls.
+LLM_CALLS_TABLE_ENABLED = os.getenv("LLM_CALLS_TABLE_ENABLED", "false").lower() in ('1', 'true', 'yes')
+LLM_METRICS_TOP_PATIENTS = int(os.getenv("LLM_METRICS_TOP_PATIENTS", "20"))
+
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+PROMPT_RATE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+GENERATION_RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+class Histogram:
+    # Counts per upper bound; the last count is everything above the largest bound.
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation ('+Inf' above the last bound).
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return "+Inf"
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.bounds, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+        }
+
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.stopped_early = 0
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self.histograms = {
+            "elapsed_secs": Histogram(SECONDS_BUCKETS),
+            "first_token_secs": Histogram(SECONDS_BUCKETS),
+            "prompt_tokens": Histogram(TOKEN_BUCKETS),
+            "generated_tokens": Histogram(TOKEN_BUCKETS),
+            "prompt_tokens_per_sec": Histogram(PROMPT_RATE_BUCKETS),
+            "generated_tokens_per_sec": Histogram(GENERATION_RATE_BUCKETS),
+        }
+
+    def add(self, call):
+        self.calls += 1
+        self.failures += 0 if call["ok"] else 1
+        self.stopped_early += 1 if call["stopped_early"] else 0
+        self.prompt_tokens += call["prompt_tokens"] or 0
+        self.generated_tokens += call["generated_tokens"] or 0
+        for name, histogram in self.histograms.items():
+            if call.get(name) is not None:
+                histogram.observe(call[name])
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "stopped_early": self.stopped_early,
+            "prompt_tokens": self.prompt_tokens,
+            "generated_tokens": self.generated_tokens,
+            "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+_lock = threading.Lock()
+_by_call = {}
+_by_patient = {}
+_started_at = time.time()
+
+def response_counters(response):
+    # Token counts and durations from a non-streamed response or the final stream chunk.
+    counters = {}
+    if response.get('prompt_eval_count') is not None:
+        counters['prompt_eval_count'] = response['prompt_eval_count']
+    if response.get('prompt_eval_duration') is not None:
+        counters['prompt_eval_secs'] = response['prompt_eval_duration'] / 1e9
+    if response.get('eval_count') is not None:
+        counters['eval_count'] = response['eval_count']
+    if response.get('eval_duration') is not None:
+        counters['eval_secs'] = response['eval_duration'] / 1e9
+    return counters
+
+def _rate(tokens, secs):
+    return tokens / secs if tokens and secs else None
+
+def record(model, purpose, stats, patient_id=None, attempt=None, streamed=False, error=None):
+    # stats holds elapsed_secs and whatever of first_token_secs, prompt_eval_count,
+    # prompt_eval_secs, eval_count, eval_secs and stopped_early the call produced.
+    # A stream closed early never sees Ollama's final chunk, so its counts are unknown.
+    call = {
+        "created_at": time.time(),
+        "model": model,
+        "purpose": purpose,
+        "patient_id": patient_id,
+        "attempt": attempt,
+        "ok": 1 if error is None else 0,
+        "streamed": 1 if streamed else 0,
+        "stopped_early": 1 if stats.get("stopped_early") else 0,
+        "prompt_tokens": stats.get("prompt_eval_count"),
+        "prompt_eval_secs": stats.get("prompt_eval_secs"),
+        "generated_tokens": stats.get("eval_count"),
+        "eval_secs": stats.get("eval_secs"),
+        "first_token_secs": stats.get("first_token_secs"),
+        "elapsed_secs": stats["elapsed_secs"],
+        "error": str(error)[:500] if error is not None else None,
+    }
+    call["prompt_tokens_per_sec"] = _rate(call["prompt_tokens"], call["prompt_eval_secs"])
+    call["generated_tokens_per_sec"] = _rate(call["generated_tokens"], call["eval_secs"])
+
+    with _lock:
+        _by_call.setdefault((model, purpose), _CallStats()).add(call)
+        if patient_id is not None:
+            totals = _by_patient.setdefault(
+                patient_id, {"calls": 0, "prompt_tokens": 0, "generated_tokens": 0, "elapsed_secs": 0.0}
+            )
+            totals["calls"] += 1
+            totals["prompt_tokens"] += call["prompt_tokens"] or 0
+            totals["generated_tokens"] += call["generated_tokens"] or 0
+            totals["elapsed_secs"] += call["elapsed_secs"]
+
+    if LLM_CALLS_TABLE_ENABLED:
+        try:
+            llm_calls.append(call)
+        except Exception as exc:
+            print(f"[LLM] Could not record call in llm_calls: {exc}", flush=True)
+    return call
+
+def snapshot():
+    with _lock:
+        calls = [
+            {"model": model, "purpose": purpose, **stats.snapshot()}
+            for (model, purpose), stats in sorted(_by_call.items())
+        ]
+        patients = sorted(
+            ({"patient_id": patient_id, **totals} for patient_id, totals in _by_patient.items()),
+            key=lambda entry: entry["prompt_tokens"] + entry["generated_tokens"],
+            reverse=True,
+        )[:LLM_METRICS_TOP_PATIENTS]
+    for entry in patients:
+        entry["elapsed_secs"] = round(entry["elapsed_secs"], 3)
+    return {
+        "since": _started_at,
+        "calls": calls,
+        "top_patients": patients,
+        "llm_calls_table": LLM_CALLS_TABLE_ENABLED,
+    }
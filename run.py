@@ -1,24 +1,41 @@
-import argon2
 from dotenv import load_dotenv
 from flask import Flask, render_template
-from llm import chatbot
+from llm import client as llm_client
+from llm import dedup
+from llm import image_summaries
+from llm import reports
+from llm import pregenerate
+from llm import telemetry
+from llm.questions import LLM_MODEL, generate_next_questions, store_next_questions
 from db_manager import db
 from datetime import datetime, timedelta
 from auth import utils as auth
+from auth import hashing
+from auth import tokens
+from db_manager import export
+from db_manager import jobs
+from db_manager import image_cache
+from db_manager import llm_calls
+from llm.job_workers import PermanentJobError, QuestionJobWorkers
+import hashlib
+import json
 import os
+import subprocess
+import sys
 import tempfile
-import uuid
+import threading
 import jwt
 import traceback
 
 app = Flask(__name__, template_folder='pages')
 
-# Upgrade to llama3:70b once computing power is increased
-LLM_MODEL = 'llama3.1:8b'
 IMAGE_SUMMARY_MODEL = 'gemma4:e4b'
-TEMP_IMAGE_DIR = './temp_images'
-ph = argon2.PasswordHasher()
 load_dotenv()
+QUESTION_JOB_WORKERS = int(os.getenv("QUESTION_JOB_WORKERS", "2"))
+QUESTION_GENERATION_ASYNC = os.getenv("QUESTION_GENERATION_ASYNC", "false").lower() in ('1', 'true', 'yes')
+IDEMPOTENCY_KEY_TTL_SECS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24")) * 3600
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+tokens.load_keys()
 
 from functools import wraps
 from flask import request, jsonify
@@ -48,6 +65,12 @@ def error_response(message, status_code, details=None, exc=None):
     return jsonify(payload), status_code
 
 
+def busy_response(exc):
+    response, status_code = error_response('Server busy, retry shortly', 503, details=str(exc))
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response, status_code
+
+
 @app.errorhandler(Exception)
 def handle_unexpected_error(exc):
     return error_response('Internal server error', 500, details=str(exc), exc=exc)
@@ -64,7 +87,7 @@ def require_jwt(required_role=None):
 
             token = auth_header.split()[1]
             try:
-                payload = jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=['HS256'])
+                payload = tokens.decode(token)
             except jwt.ExpiredSignatureError:
                 return error_response('Token expired', 401)
             except jwt.InvalidTokenError:
@@ -100,15 +123,21 @@ def login():
     if not patient:
         return error_response('Patient not found', 404)
 
+    if role not in db.PASSWORD_COLUMNS:
+        return error_response('Invalid role', 400)
+
     try:
-        if role == 'patient':
-            ph.verify(patient['patient_password'], password)
-        elif role == 'caregiver':
-            ph.verify(patient['caregiver_password'], password)
-        else:
-            return error_response('Invalid role', 400)
+        matches, new_hash = hashing.verify_password(patient[db.PASSWORD_COLUMNS[role]], password)
+    except hashing.HashingBusy as exc:
+        return busy_response(exc)
     except Exception as exc:
         return error_response('Unauthorized', 401, details=str(exc), exc=exc)
+    if not matches:
+        return error_response('Unauthorized', 401, details='The password does not match the supplied hash')
+
+    if new_hash:
+        db.update_patient_password(patient_id, role, new_hash)
+        print(f"[AUTH] Rehashed {role} password for patient_id={patient_id}", flush=True)
 
     return jsonify({
         'access_token': auth.generate_access_token(patient_id, role),
@@ -124,7 +153,8 @@ def refresh():
     token = auth_header.split()[1]
 
     try:
-        payload = jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=['HS256'])
+        # refresh tokens are single-use, so there is no point caching them
+        payload = tokens.decode(token, use_cache=False)
     except jwt.ExpiredSignatureError:
         return error_response('Refresh token expired', 401)
     except jwt.InvalidTokenError:
@@ -133,16 +163,12 @@ def refresh():
     if payload.get('token_type') != 'refresh':
         return error_response('Not a refresh token', 401)
 
-    # ensure the token is still in the db
-    patient_id = auth.is_valid_refresh_token(token)
-    if not patient_id:
+    # consume the stored rt and store its replacement in one transaction
+    new_refresh = auth.rotate_refresh_token(token, payload["patient_id"], payload["role"])
+    if not new_refresh:
         return error_response('Invalid or expired refresh token', 401)
 
-    # allg – remove old rt and issue new tokens
-    auth.delete_refresh_token(token)
-
     new_access = auth.generate_access_token(payload["patient_id"], payload["role"])
-    new_refresh = auth.generate_refresh_token(payload["patient_id"], payload["role"])
 
     return jsonify({
         'access_token': new_access,
@@ -154,30 +180,103 @@ def refresh():
 def view_patients():
     return render_template("patients.html")
 
+PATIENTS_PAGE_DEFAULT_LIMIT = 50
+PATIENTS_PAGE_MAX_LIMIT = 500
+PATIENTS_DATA_LOADERS = {
+    'cognitive_history': db.get_cognitive_history_for_patients,
+    'question_history': db.get_question_history_for_patients,
+    'image_summaries': db.get_image_summaries_for_patients,
+    'next_questions': db.get_next_questions_for_patients,
+}
+PATIENTS_DATA_INCLUDES = set(PATIENTS_DATA_LOADERS) | {'counts'}
+
 @app.route('/patients_data', methods=['GET'])
 def patients_data():
-    patients = db.get_all_patients()
-    for p in patients:
-        p['cognitive_history'] = db.get_full_cognitive_history(p['id'])
-        p['question_history'] = db.get_full_question_history(p['id'])
-        p['image_summaries'] = db.get_full_image_summaries(p['id'])
-        p['next_questions'] = db.get_next_questions(p['id'])
-    return jsonify({'patients': patients})
-
-def prep_next_questions(patient_data, max_entries=50):
-    for i in ['patient_id', 'patient_password', 'caregiver_password', 'next_questions']:
-        patient_data.pop(i, None)
-    patient_data["cognitive_history"] = db.get_trimmed_cognitive_history(patient_data["id"], max_entries)
-    patient_data["recent_question_history"] = db.get_full_question_history(patient_data["id"])[-max_entries:]
-    patient_data["image_summaries"] = [
-        entry["summary"] for entry in db.get_random_image_summaries(patient_data["id"], 5)
-    ]
-    print(f"[QUESTIONS] Preparing next questions for patient_id={patient_data['id']}", flush=True)
-    qns = chatbot.new_questions(patient_data, model=LLM_MODEL)
-    if not isinstance(qns, list) or len(qns) != 5 or not all(isinstance(q, str) and q.strip() for q in qns):
-        raise ValueError(f"Expected 5 generated questions, got: {qns}")
-    print(f"[QUESTIONS] Generated and validated 5 questions for patient_id={patient_data['id']}", flush=True)
-    return qns
+    try:
+        limit = int(request.args.get('limit', PATIENTS_PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        return error_response('limit must be an integer', 400)
+    if limit < 1 or limit > PATIENTS_PAGE_MAX_LIMIT:
+        return error_response(f'limit must be between 1 and {PATIENTS_PAGE_MAX_LIMIT}', 400)
+
+    include_arg = request.args.get('include')
+    if include_arg is None:
+        include = set(PATIENTS_DATA_LOADERS)
+    else:
+        include = {field.strip() for field in include_arg.split(',') if field.strip()}
+        unknown = include - PATIENTS_DATA_INCLUDES
+        if unknown:
+            return error_response(
+                f"Unknown include fields: {', '.join(sorted(unknown))}",
+                400,
+                details={'allowed': sorted(PATIENTS_DATA_INCLUDES)},
+            )
+
+    patient_id = request.args.get('patient_id')
+    patients = db.get_patients_page(
+        after=request.args.get('after'),
+        limit=limit,
+        patient_id=patient_id,
+    )
+    patient_ids = [p['id'] for p in patients]
+
+    for field, loader in PATIENTS_DATA_LOADERS.items():
+        if field in include:
+            grouped = loader(patient_ids)
+            for p in patients:
+                p[field] = grouped[p['id']]
+    if 'counts' in include:
+        counts = db.get_history_counts_for_patients(patient_ids)
+        for p in patients:
+            p.update(counts[p['id']])
+
+    next_cursor = patient_ids[-1] if len(patients) == limit and patient_id is None else None
+    return jsonify({'patients': patients, 'next_cursor': next_cursor})
+
+def run_question_job(job):
+    patient = db.get_patient_profile(job['patient_id'])
+    if not patient:
+        raise PermanentJobError(f"Patient ID {job['patient_id']} not found")
+    return generate_next_questions(dict(patient))
+
+question_workers = QuestionJobWorkers(run_question_job, workers=QUESTION_JOB_WORKERS)
+
+def wants_async_generation(payload):
+    value = payload.get('async', QUESTION_GENERATION_ASYNC)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def job_accepted_response(message, job_id):
+    question_workers.wake()
+    return {
+        'message': message,
+        'job_id': job_id,
+        'status_url': f'/question_jobs/{job_id}',
+    }, 202
+
+def idempotent_response(patient_id, idempotency_key, body, status_code):
+    if idempotency_key:
+        db.store_idempotent_response(patient_id, idempotency_key, status_code, body)
+    return body, status_code
+
+def replay_idempotent_request(patient, idempotency_key, request_hash, previous):
+    patient_id = patient['id']
+    if previous['request_hash'] != request_hash:
+        return error_response('Idempotency-Key was already used with a different payload', 422)
+    if previous['status_code'] is not None:
+        return previous['response'], previous['status_code'], {'Idempotent-Replayed': 'true'}
+
+    # The session is stored but no response was recorded: the first request is
+    # still generating (join it) or failed (generate again).
+    try:
+        updated_next_qns = generate_next_questions(dict(patient))
+    except Exception as exc:
+        return error_response('Failed to generate next questions', 502, details=str(exc), exc=exc)
+    return idempotent_response(patient_id, idempotency_key, {
+        'message': f'Data appended for patient {patient_id}',
+        'next_questions': updated_next_qns
+    }, 200)
 
 @app.route('/process_patient_data', methods=['POST'])
 @require_jwt(required_role='patient')
@@ -186,6 +285,10 @@ def process_data():
     if not payload:
         return error_response('No JSON payload received', 400)
 
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None and not 1 <= len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        return error_response(f'Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters', 400)
+
     patient_id = payload.get('patient_id')
     if not patient_id:
         return error_response('Missing patient_id', 400)
@@ -204,27 +307,60 @@ def process_data():
     if not all(isinstance(answer, str) for answer in answers):
         return error_response('transcript_text must contain only strings', 400)
 
-    patient = db.get_patient_by_id(patient_id)
+    patient = db.get_patient_profile(patient_id)
     if not patient:
         return error_response(f'Patient ID {patient_id} not found', 404)
 
-    db.append_cognitive_history(patient_id, features)
+    # Store the session in one transaction; the LLM call below runs outside it so
+    # the write lock is not held while questions are generated. A retried request
+    # with the same Idempotency-Key finds its key claimed and stores nothing.
+    run_async = wants_async_generation(payload)
+    request_hash = hashlib.sha256(
+        json.dumps({'features': features, 'transcript_text': answers}).encode('utf-8')
+    ).hexdigest()
+    with db.unit_of_work():
+        previous = db.claim_idempotency_key(
+            patient_id, idempotency_key, request_hash, IDEMPOTENCY_KEY_TTL_SECS
+        ) if idempotency_key else None
+
+        if previous is None:
+            session = db.append_cognitive_history(patient_id, features)
+
+            # Fetch next_questions before updating
+            next_qns = db.get_next_questions(patient_id)
+
+            db.append_question_history(patient_id, next_qns, answers)
+
+            # A set pre-generated off-peak replaces the LLM call entirely.
+            staged_qns = db.pop_staged_questions(patient_id, pregenerate.STAGED_QUESTIONS_MAX_AGE_SECS)
+
+            job_id = jobs.enqueue(patient_id) if run_async and not staged_qns else None
+
+    if previous is not None:
+        return replay_idempotent_request(patient, idempotency_key, request_hash, previous)
 
-    # Fetch next_questions before updating
-    next_qns = db.get_next_questions(patient_id)
+    if staged_qns:
+        # Written after the commit: the write guard's lock must never be waited on
+        # while this thread holds the SQLite write transaction.
+        store_next_questions(patient_id, session['id'], staged_qns)
+        return idempotent_response(patient_id, idempotency_key, {
+            'message': f'Data appended for patient {patient_id}',
+            'next_questions': staged_qns
+        }, 200)
 
-    db.append_question_history(patient_id, next_qns, answers)
+    if run_async:
+        body, status_code = job_accepted_response(f'Data appended for patient {patient_id}', job_id)
+        return idempotent_response(patient_id, idempotency_key, body, status_code)
 
     try:
-        updated_next_qns = prep_next_questions(dict(patient))
+        updated_next_qns = generate_next_questions(dict(patient))
     except Exception as exc:
         return error_response('Failed to generate next questions', 502, details=str(exc), exc=exc)
-    db.update_next_questions(patient_id, updated_next_qns)
 
-    return {
+    return idempotent_response(patient_id, idempotency_key, {
         'message': f'Data appended for patient {patient_id}',
         'next_questions': updated_next_qns
-    }, 200
+    }, 200)
 
 @app.route('/create', methods=['GET'])
 def create_patient():
@@ -250,8 +386,13 @@ def create_patient_api():
         return error_response(f"Missing fields: {', '.join(missing_fields)}", 400)
 
     patient_id = data['patient_id']
-    patient_password = ph.hash(data['patient_password'])
-    caregiver_password = ph.hash(data['caregiver_password'])
+    try:
+        patient_password, caregiver_password = hashing.hash_passwords(
+            data['patient_password'],
+            data['caregiver_password'],
+        )
+    except hashing.HashingBusy as exc:
+        return busy_response(exc)
     full_name = data['full_name']
     first_name = data['first_name']
 
@@ -262,22 +403,28 @@ def create_patient_api():
 
     gender = data['gender']
 
-    db.create_new_patient(
-        patient_id=patient_id,
-        patient_password=patient_password,
-        caregiver_password=caregiver_password,
-        full_name=full_name,
-        first_name=first_name,
-        age=age,
-        gender=gender
-    )
+    run_async = wants_async_generation(data)
+    with db.unit_of_work():
+        db.create_new_patient(
+            patient_id=patient_id,
+            patient_password=patient_password,
+            caregiver_password=caregiver_password,
+            full_name=full_name,
+            first_name=first_name,
+            age=age,
+            gender=gender
+        )
+        job_id = jobs.enqueue(patient_id) if run_async else None
 
-    patient = db.get_patient_by_id(patient_id)
+    if run_async:
+        return job_accepted_response(f'Patient {patient_id} created successfully', job_id)
+
+    patient = db.get_patient_profile(patient_id)
     if not patient:
         return error_response(f'Patient ID {patient_id} not found', 404)
 
     try:
-        updated_next_qns = prep_next_questions(dict(patient))
+        updated_next_qns = generate_next_questions(dict(patient))
     except Exception as exc:
         return error_response(
             'Patient created, but failed to generate initial questions',
@@ -285,7 +432,6 @@ def create_patient_api():
             details=str(exc),
             exc=exc,
         )
-    db.update_next_questions(patient_id, updated_next_qns)
 
     return {
         'message': f'Patient {patient_id} created successfully',
@@ -295,7 +441,7 @@ def create_patient_api():
 @app.route('/upload_patient_images', methods=['POST'])
 @require_jwt(required_role='caregiver')
 def upload_patient_images():
-    patient = db.get_patient_by_id(request.patient_id)
+    patient = db.get_patient_profile(request.patient_id)
     if not patient:
         return error_response(f'Patient ID {request.patient_id} not found', 404)
 
@@ -304,36 +450,36 @@ def upload_patient_images():
     if not valid_files:
         return error_response('Missing image files. Use repeated form field name "image".', 400)
 
-    os.makedirs(TEMP_IMAGE_DIR, exist_ok=True)
+    results = image_summaries.summarize_uploads(
+        [(file.filename, file.stream) for file in valid_files],
+        model=IMAGE_SUMMARY_MODEL,
+        patient_id=request.patient_id,
+    )
 
-    stored_summaries = []
+    summaries = []
     errors = []
-
-    for file in valid_files:
-        suffix = os.path.splitext(file.filename)[1] or '.jpg'
-        temp_path = os.path.join(TEMP_IMAGE_DIR, f'{uuid.uuid4().hex}{suffix}')
-        try:
-            file.save(temp_path)
-            print(
-                f"[IMAGES] Saved upload for patient_id={request.patient_id} to {temp_path}",
-                flush=True,
-            )
-            summary = chatbot.summarize_image(temp_path, model=IMAGE_SUMMARY_MODEL)
-            stored_summaries.append(db.append_image_summary(request.patient_id, summary))
-        except Exception as exc:
+    for filename, summary, cache_match, exc in results:
+        if exc is not None:
             log_error(
                 f"Failed processing uploaded image for patient_id={request.patient_id}, "
-                f"filename={file.filename}: {exc}",
+                f"filename={filename}: {exc}",
                 exc=exc,
             )
             errors.append({
-                'filename': file.filename,
+                'filename': filename,
                 'error': str(exc),
             })
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"[IMAGES] Deleted temp file {temp_path}", flush=True)
+        else:
+            summaries.append((summary, cache_match))
+
+    stored_summaries = []
+    if summaries:
+        try:
+            stored_summaries = db.append_image_summaries(request.patient_id, [summary for summary, _ in summaries])
+        except Exception as exc:
+            return error_response('Failed to store image summaries', 500, exc=exc)
+        for stored, (_, cache_match) in zip(stored_summaries, summaries):
+            stored['cache_hit'] = cache_match
 
     if not stored_summaries:
         return error_response('Failed to process uploaded images', 502, details=errors)
@@ -348,7 +494,7 @@ def upload_patient_images():
 @app.route('/patient_image_summaries', methods=['GET'])
 @require_jwt(required_role='caregiver')
 def get_patient_image_summaries():
-    patient = db.get_patient_by_id(request.patient_id)
+    patient = db.get_patient_profile(request.patient_id)
     if not patient:
         return error_response(f'Patient ID {request.patient_id} not found', 404)
 
@@ -360,13 +506,34 @@ def get_patient_image_summaries():
 @app.route('/next_questions', methods=['GET'])
 @require_jwt(required_role='patient')
 def get_next_questions():
-    patient = db.get_patient_by_id(request.patient_id)
+    patient = db.get_patient_profile(request.patient_id)
     if not patient:
         return error_response(f'Patient ID {request.patient_id} not found', 404)
 
-    return {
+    response = {
         'patient_id': request.patient_id,
         'next_questions': db.get_next_questions(request.patient_id)
+    }
+    pending_job = jobs.get_pending_job(request.patient_id)
+    if pending_job:
+        response['pending_job'] = {'job_id': pending_job['id'], 'status': pending_job['status']}
+    return response, 200
+
+@app.route('/question_jobs/<int:job_id>', methods=['GET'])
+@require_jwt()
+def get_question_job(job_id):
+    job = jobs.get_job(job_id)
+    if not job or job['patient_id'] != request.patient_id:
+        return error_response(f'Job {job_id} not found', 404)
+
+    return {
+        'job_id': job['id'],
+        'patient_id': job['patient_id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'max_attempts': job['max_attempts'],
+        'last_error': job['last_error'],
+        'next_questions': job['result'],
     }, 200
 
 @app.route('/pull_cognitive_history', methods=['POST'])
@@ -378,23 +545,140 @@ def pull_cognitive_history():
 
     patient_id = payload.get('patient_id')
     days = payload.get('days')
+    since = payload.get('since')
+    until = payload.get('until')
+    limit = payload.get('limit')
+    cursor = payload.get('cursor')
 
-    if not patient_id or days is None:
+    if not patient_id or (days is None and since is None and until is None):
         return error_response('Missing patient_id or days', 400)
 
-    full_history = db.get_full_cognitive_history(patient_id)
+    if days is not None and days != -1:
+        if not isinstance(days, (int, float)) or isinstance(days, bool) or days < 0:
+            return error_response('days must be -1 or a non-negative number', 400)
+        if since is None:
+            # Dates are stored as YYYY-MM-DD; comparing against the full timestamp keeps
+            # the old behaviour of excluding the boundary day once its midnight has passed.
+            since = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
 
-    if days == -1:
-        return {'cognitive_history': full_history}
+    for name, value in (('since', since), ('until', until), ('cursor', cursor)):
+        if value is not None and not isinstance(value, str):
+            return error_response(f'{name} must be a string', 400)
+    if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+        return error_response('limit must be a positive integer', 400)
 
-    cutoff_date = datetime.now() - timedelta(days=days)
+    try:
+        history, next_cursor = db.get_cognitive_history_range(
+            patient_id,
+            since=since,
+            until=until,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as exc:
+        return error_response('Invalid cursor', 400, details=str(exc))
 
-    filtered_history = [
-        entry for entry in full_history
-        if datetime.fromisoformat(entry['date']) >= cutoff_date
-    ]
+    return {'cognitive_history': history, 'next_cursor': next_cursor}
+
+REPORT_RETRY_AFTER_SECS = int(os.getenv("REPORT_RETRY_AFTER_SECS", "15"))
+
+@app.route('/cognitive_report', methods=['GET'])
+@require_jwt(required_role='caregiver')
+def get_cognitive_report():
+    days = request.args.get('days', '7')
+    if not days.isdigit() or not 1 <= int(days) <= 365:
+        return error_response('days must be an integer between 1 and 365', 400)
+    days = int(days)
+
+    patient = db.get_patient_profile(request.patient_id)
+    if not patient:
+        return error_response(f'Patient ID {request.patient_id} not found', 404)
+
+    status, report, error = reports.get_report(patient, days)
+    if status == 'empty':
+        return error_response(f'No cognitive history for patient {request.patient_id}', 404)
+    if status == 'failed':
+        return error_response('Report generation failed', 502, details=error)
+
+    response = {'patient_id': request.patient_id, 'days': days, 'status': status}
+    if report:
+        response.update(
+            report=report['report'],
+            generated_at=datetime.fromtimestamp(report['created_at']).isoformat(timespec='seconds'),
+            stale=status != 'ready',
+        )
+    if status == 'ready':
+        return response, 200
+    return response, 202, {'Retry-After': str(REPORT_RETRY_AFTER_SECS)}
 
-    return {'cognitive_history': filtered_history}
+@app.route('/cognitive_baseline', methods=['GET'])
+@require_jwt(required_role='caregiver')
+def get_cognitive_baseline():
+    patient = db.get_patient_profile(request.patient_id)
+    if not patient:
+        return error_response(f'Patient ID {request.patient_id} not found', 404)
+
+    latest = db.get_latest_feature_zscores(request.patient_id)
+    if latest is None:
+        return error_response('No cognitive history recorded yet', 404)
+
+    return {'patient_id': request.patient_id, **latest}, 200
+
+# Readiness probe for load balancers: 503 until every configured model is resident in Ollama.
+@app.route('/ready', methods=['GET'])
+def ready():
+    report = llm_client.readiness([LLM_MODEL, IMAGE_SUMMARY_MODEL])
+    return report, 200 if report['ready'] else 503
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return {
+        'db': db.cache_stats(),
+        'jwt': tokens.cache_stats(),
+        'question_embeddings': dedup.cache_stats(),
+        'image_summaries': image_cache.stats(),
+    }, 200
+
+@app.route('/llm_metrics', methods=['GET'])
+def llm_metrics():
+    metrics = telemetry.snapshot()
+    days = request.args.get('days')
+    if days is not None:
+        if not telemetry.LLM_CALLS_TABLE_ENABLED:
+            return error_response('days requires LLM_CALLS_TABLE_ENABLED=true', 400)
+        if not days.isdigit() or not 1 <= int(days) <= 365:
+            return error_response('days must be an integer between 1 and 365', 400)
+        metrics['table'] = llm_calls.summary(int(days))
+    return metrics, 200
+
+_export_lock = threading.Lock()
+_export_process = None
+
+def _export_running():
+    return _export_process is not None and _export_process.poll() is None
+
+# Runs the Parquet export in a child process so it never competes with request threads.
+@app.route('/export_history', methods=['POST'])
+def start_history_export():
+    global _export_process
+    payload = request.get_json(silent=True) or {}
+    command = [sys.executable, '-m', 'db_manager.export']
+    if payload.get('full'):
+        command.append('--full')
+
+    with _export_lock:
+        if _export_running():
+            return error_response('An export is already running', 409)
+        _export_process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    return {'message': 'Export started', 'pid': _export_process.pid}, 202
+
+@app.route('/export_history', methods=['GET'])
+def history_export_status():
+    return {
+        'running': _export_running(),
+        'last_run': export.read_last_run(),
+    }, 200
 
 # DELETE BEFORE PUBLISH (THIS IS JUST FOR DEVELOPMENT PURPOSES)
 @app.route('/clear_patients', methods=['POST'])
@@ -402,5 +686,37 @@ def clear_patients():
     db.hard_clear()
     return {'message': 'Cleared all patients and related data'}, 200
 
+REFRESH_TOKEN_SWEEP_INTERVAL_SECS = int(os.getenv("REFRESH_TOKEN_SWEEP_INTERVAL_SECS", "3600"))
+_background_services_started = False
+
+def start_background_services():
+    # Token sweeper, question job workers, model warm-up and the nightly scheduler.
+    global _background_services_started
+    if _background_services_started:
+        return
+    _background_services_started = True
+
+    if REFRESH_TOKEN_SWEEP_INTERVAL_SECS > 0:
+        auth.start_refresh_token_sweeper(REFRESH_TOKEN_SWEEP_INTERVAL_SECS)
+
+    if QUESTION_JOB_WORKERS > 0:
+        question_workers.start()
+
+    if os.getenv("LLM_WARMUP", "true").lower() in ('1', 'true', 'yes'):
+        llm_client.start_warm_up([LLM_MODEL, IMAGE_SUMMARY_MODEL])
+
+    if os.getenv("PREGEN_SCHEDULER_ENABLED", "false").lower() in ('1', 'true', 'yes'):
+        pregenerate.start_nightly_scheduler()
+
 if __name__ == '__main__':
+    # The debug reloader runs this file twice: a parent that only watches for
+    # changes and the serving child (WERKZEUG_RUN_MAIN=true). Only the child
+    # starts the background services.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     app.run(port=6767, debug=True)
+elif os.getenv("BACKGROUND_SERVICES", "false").lower() in ('1', 'true', 'yes'):
+    # Opt-in for WSGI servers that import run:app once per serving worker
+    # (e.g. gunicorn without --preload). Plain imports (flask run's reloader
+    # parent, benchmarks, scripts) start nothing.
+    start_background_services()
@@ -0,0 +1,46 @@
+from llm import chatbot
+from llm import client as llm_client
+
+QUESTIONS = [
+    "What did you have for breakfast today?",
+    "Who did you talk to on the phone this week?",
+    "Where did you grow up?",
+    "What was your favourite song as a teenager?",
+    "Which pet did your family have?",
+]
+
+
+class FakeStreamingClient:
+    # Streams a fixed reply in small chunks and counts chat calls.
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def chat(self, stream=False, **kwargs):
+        self.calls += 1
+        if not stream:
+            return {"message": {"content": self.reply}}
+        pieces = [self.reply[i:i + 7] for i in range(0, len(self.reply), 7)]
+        return iter([{"message": {"content": piece}, "done": False} for piece in pieces])
+
+
+def _stream_questions(monkeypatch, reply):
+    fake = FakeStreamingClient(reply)
+    monkeypatch.setattr(llm_client, "_client", fake)
+    monkeypatch.setattr(chatbot, "QUESTION_STREAMING", True)
+    return fake, chatbot.new_questions({"id": "P001"}, patient_context="context")
+
+
+def test_preamble_before_questions_is_skipped(monkeypatch):
+    reply = "Sure! Here are your questions:\n\n" + "\n".join(f"{i}. {q}" for i, q in enumerate(QUESTIONS, 1))
+    fake, questions = _stream_questions(monkeypatch, reply)
+    assert questions == QUESTIONS
+    assert fake.calls == 1
+
+
+def test_commentary_after_questions_aborts_stream():
+    checker = chatbot._QuestionStreamChecker()
+    assert checker("Here are your questions:") is None
+    assert checker(QUESTIONS[0]) is None
+    assert checker("Some notes on these:") == "preamble or commentary"
+    assert checker("<think>") == "think block"